@@ -0,0 +1,59 @@
+"""
+Helpers for batch jobs that fan work out over all users in a process pool.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Iterator, List, Optional, Tuple
+import os
+from app.database import Shard, shard_session, shards
+from app.models import User
+
+def user_id_chunks(shard: Shard, chunk_size: int) -> Iterator[List[int]]:
+    """A shard's user ids in ascending chunks, paged by key so each page is an index range scan."""
+    db = shard_session(shard)
+    try:
+        last_id = 0
+        while True:
+            ids = [
+                user_id for (user_id,) in
+                db.query(User.id).filter(User.id > last_id).order_by(User.id).limit(chunk_size).all()
+            ]
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+    finally:
+        db.close()
+
+def all_user_id_chunks(chunk_size: int) -> Iterator[Tuple[int, List[int]]]:
+    """(shard id, user ids) chunks across every shard."""
+    for shard in shards:
+        for ids in user_id_chunks(shard, chunk_size):
+            yield shard.id, ids
+
+def _init_worker():
+    # Connections inherited from the parent must not be shared across processes
+    for shard in shards:
+        shard.engine.dispose(close=False)
+
+def run_chunked(
+    worker: Callable[[int, List[int]], int],
+    chunk_size: int = 1000,
+    workers: Optional[int] = None
+) -> int:
+    """
+    Run `worker(shard_id, user_ids)` for every chunk of users across a process pool and
+    return the sum of its results. At most two chunks per worker are in flight,
+    so memory stays flat no matter how many users there are.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = set()
+        for shard_id, chunk in all_user_id_chunks(chunk_size):
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                total += sum(f.result() for f in done)
+            pending.add(pool.submit(worker, shard_id, chunk))
+        total += sum(f.result() for f in wait(pending).done)
+    return total
@@ -0,0 +1,124 @@
+"""
+Incremental budget tracking.
+
+Every transaction write adjusts a per-(user, category, month) spend counter in
+the same database transaction, so budget checks never rescan transactions.
+Threshold crossings are written to the budget_alerts outbox and, once the
+transaction commits, passed to any registered in-process sinks.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import Budget, BudgetCounter, BudgetAlert, TransactionCategory
+
+logger = logging.getLogger(__name__)
+
+AlertSink = Callable[[dict], None]
+_alert_sinks: List[AlertSink] = []
+
+def register_alert_sink(sink: AlertSink):
+    """Call `sink(alert)` with a dict of alert fields after its transaction commits."""
+    _alert_sinks.append(sink)
+
+def month_start(timestamp: Optional[datetime]) -> date:
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc)
+    elif timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return date(timestamp.year, timestamp.month, 1)
+
+def spending_amount(category: TransactionCategory, amount: float) -> float:
+    # Same definition of an expense as the dashboard
+    if category == TransactionCategory.SALARY or amount >= 0:
+        return 0.0
+    return -amount
+
+def increment_counter(db: Session, user_id: int, category: TransactionCategory, month: date, delta: float) -> float:
+    """Atomically add delta to a counter, creating it if needed. Returns the new total."""
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = pg_insert if dialect == "postgresql" else sqlite_insert
+        stmt = insert(BudgetCounter).values(
+            user_id=user_id, category=category, month=month, spent=delta
+        ).on_conflict_do_update(
+            index_elements=["user_id", "category", "month"],
+            set_={"spent": BudgetCounter.__table__.c.spent + delta}
+        ).returning(BudgetCounter.__table__.c.spent)
+        return db.execute(stmt).scalar_one()
+
+    counter = db.query(BudgetCounter).filter(
+        BudgetCounter.user_id == user_id,
+        BudgetCounter.category == category,
+        BudgetCounter.month == month
+    ).with_for_update().first()
+    if counter is None:
+        counter = BudgetCounter(user_id=user_id, category=category, month=month, spent=0.0)
+        db.add(counter)
+    counter.spent = (counter.spent or 0.0) + delta
+    db.flush()
+    return counter.spent
+
+def record_spending(
+    db: Session,
+    user_id: int,
+    entries: Iterable[Tuple[TransactionCategory, Optional[datetime], float]],
+    reverse: bool = False
+):
+    """
+    Add (category, timestamp, amount) transactions to the user's counters, or
+    remove them with reverse=True. Does not commit.
+    """
+    deltas: Dict[Tuple[TransactionCategory, date], float] = defaultdict(float)
+    for category, timestamp, amount in entries:
+        spent = spending_amount(category, amount)
+        if spent:
+            deltas[(category, month_start(timestamp))] += -spent if reverse else spent
+    if not deltas:
+        return
+
+    budgets = {
+        b.category: b for b in db.query(Budget).filter(Budget.user_id == user_id).all()
+    }
+    for (category, month), delta in deltas.items():
+        total = increment_counter(db, user_id, category, month, delta)
+        budget = budgets.get(category)
+        if budget is not None and delta > 0:
+            _check_thresholds(db, budget, month, total - delta, total)
+
+def _check_thresholds(db: Session, budget: Budget, month: date, before: float, after: float):
+    for threshold in sorted({budget.alert_threshold, 1.0}):
+        level = threshold * budget.monthly_limit
+        if before < level <= after:
+            alert = {
+                "user_id": budget.user_id,
+                "category": budget.category,
+                "month": month,
+                "threshold": threshold,
+                "spent": after,
+                "monthly_limit": budget.monthly_limit,
+            }
+            db.add(BudgetAlert(**alert))
+            # Sinks get a plain dict: ORM objects can't be loaded from after_commit
+            db.info.setdefault("budget_alerts", []).append(alert)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _dispatch_alerts(session):
+    alerts = session.info.pop("budget_alerts", None)
+    if not alerts:
+        return
+    for alert in alerts:
+        for sink in _alert_sinks:
+            try:
+                sink(alert)
+            except Exception:
+                logger.exception("Budget alert sink failed")
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_alerts(session):
+    session.info.pop("budget_alerts", None)
@@ -0,0 +1,54 @@
+"""
+Compact columnar JSON for chart-heavy endpoints (`?format=columnar`).
+
+Instead of an array of objects, the payload holds one array per field:
+
+    {"timestamp": [1704067200000, ...], "amount": [-50.0, ...],
+     "category": {"dictionary": ["food", "rent"], "codes": [0, 1, ...]}}
+
+Timestamps are epoch milliseconds and low-cardinality fields are
+dictionary-encoded. Built straight from result rows, no per-row objects.
+"""
+import enum
+import json
+from datetime import date, datetime, timezone
+from typing import Any, List, Sequence
+from fastapi import Query
+from fastapi.responses import Response
+
+# Shared query parameter for endpoints that support both layouts
+FORMAT_QUERY = Query("rows", alias="format", pattern="^(rows|columnar)$")
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    if isinstance(value, date):
+        return int(datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp() * 1000)
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+def _dictionary_encode(values: Sequence[Any]) -> dict:
+    dictionary: dict = {}
+    codes = [dictionary.setdefault(v, len(dictionary)) for v in values]
+    return {"dictionary": list(dictionary), "codes": codes}
+
+def to_columns(rows: Sequence[Sequence[Any]], columns: List[str], dictionary: Sequence[str] = ()) -> dict:
+    """Transpose result rows into {column: values}, dictionary-encoding the named columns."""
+    data = {}
+    transposed = list(zip(*rows)) if rows else [()] * len(columns)
+    for name, values in zip(columns, transposed):
+        sample = next((v for v in values if v is not None), None)
+        # Only pay for conversion on columns that need it
+        if isinstance(sample, (datetime, date, enum.Enum)):
+            values = [_encode_value(v) for v in values]
+        else:
+            values = list(values)
+        data[name] = _dictionary_encode(values) if name in dictionary else values
+    return data
+
+def columnar_response(rows: Sequence[Sequence[Any]], columns: List[str], dictionary: Sequence[str] = ()) -> Response:
+    body = json.dumps(to_columns(rows, columns, dictionary), separators=(",", ":"))
+    return Response(content=body, media_type="application/json")
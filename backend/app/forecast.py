@@ -0,0 +1,246 @@
+"""
+Recurring-transaction detection and cash-flow forecast.
+
+A user's history is grouped by account, normalized description and amount
+band; groups whose intervals cluster around a weekly, biweekly or monthly
+period become recurring series. Detection runs over whole chunks of users at
+once with NumPy/pandas group statistics, results are cached in
+recurring_series, and new transactions either extend a known series in place
+or mark the user for a rescan. Rescan every user with:
+
+    python -m app.forecast --workers 8 --chunk-size 2000
+"""
+import argparse
+import math
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+from app.database import shard_session, shards
+from app.models import Account, RecurringScan, RecurringSeries, Transaction
+
+# History considered for detection
+LOOKBACK_DAYS = 400
+# Cached results older than this are rescanned on read even without new transactions
+MAX_SCAN_AGE = timedelta(days=1)
+FORECAST_DAYS = 90
+MIN_OCCURRENCES = 3
+# Share of intervals that must fall within tolerance of the period
+MIN_REGULARITY = 0.75
+# (period in days, tolerance in days)
+PERIODS = {
+    "weekly": (7.0, 1.5),
+    "biweekly": (14.0, 2.5),
+    "monthly": (30.44, 4.0),
+}
+# Amounts within ~15% of each other share a band
+_AMOUNT_BAND = math.log(1.15)
+_NON_LETTERS = re.compile(r"[^a-z]+")
+
+def normalize_description(description: Optional[str]) -> str:
+    # CSV uploads leave missing descriptions as NaN
+    if not isinstance(description, str):
+        return ""
+    # Drop reference numbers, dates and punctuation: "NETFLIX.COM 8841" -> "netflix com"
+    return _NON_LETTERS.sub(" ", description.lower()).strip()
+
+def series_key(description: Optional[str], amount: float) -> str:
+    band = int(round(math.log(max(abs(amount), 0.01)) / _AMOUNT_BAND))
+    return f"{normalize_description(description)}|{'+' if amount >= 0 else '-'}{band}"
+
+def detect_series(history: pd.DataFrame, now: datetime) -> pd.DataFrame:
+    """
+    Detect recurring series in a history frame with columns user_id, account_id,
+    amount, category, description, timestamp (any number of users).
+    """
+    if history.empty:
+        return pd.DataFrame()
+    df = history.copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    df["key"] = [series_key(d, a) for d, a in zip(df["description"], df["amount"])]
+    df = df.sort_values(["user_id", "account_id", "key", "timestamp"], kind="stable")
+    group = ["user_id", "account_id", "key"]
+
+    days = df["timestamp"].to_numpy(dtype="datetime64[s]").astype(np.int64) / 86400.0
+    intervals = np.diff(days, prepend=np.nan)
+    first_in_group = ~df.duplicated(subset=group, keep="first").to_numpy()
+    intervals[first_in_group] = np.nan
+    df["interval"] = intervals
+
+    stats = df.groupby(group, sort=False).agg(
+        occurrences=("amount", "size"),
+        median_interval=("interval", "median"),
+        amount=("amount", "median"),
+        category=("category", "last"),
+        description=("description", "last"),
+        last_seen=("timestamp", "max"),
+    )
+    stats = stats[stats["occurrences"] >= MIN_OCCURRENCES]
+    if stats.empty:
+        return pd.DataFrame()
+
+    # Snap each group's median interval to the nearest known period within tolerance
+    median = stats["median_interval"].to_numpy()
+    period = np.full(len(stats), np.nan)
+    tolerance = np.full(len(stats), np.nan)
+    for days_, tol in PERIODS.values():
+        match = np.isnan(period) & (np.abs(median - days_) <= tol)
+        period[match] = days_
+        tolerance[match] = tol
+    stats["period_days"] = period
+    stats["tolerance"] = tolerance
+    stats = stats[~np.isnan(period)]
+    if stats.empty:
+        return pd.DataFrame()
+
+    # Regularity: most intervals, not just the median, must sit near the period
+    joined = df.join(stats[["period_days", "tolerance"]], on=group, how="inner")
+    joined = joined[joined["interval"].notna()]
+    joined["regular"] = (joined["interval"] - joined["period_days"]).abs() <= joined["tolerance"]
+    regularity = joined.groupby(group, sort=False)["regular"].mean()
+    stats = stats.join(regularity, how="inner")
+    stats = stats[stats["regular"] >= MIN_REGULARITY]
+
+    # Series that have lapsed for more than two periods have ended
+    now = pd.Timestamp(now)
+    period_td = pd.to_timedelta(stats["period_days"], unit="D")
+    stats = stats[stats["last_seen"] + 2 * period_td >= now]
+    stats["next_expected"] = stats["last_seen"] + pd.to_timedelta(stats["period_days"], unit="D")
+    return stats.reset_index()
+
+def _load_history(db: Session, user_ids: List[int], since: datetime) -> pd.DataFrame:
+    rows = db.query(
+        Account.user_id,
+        Transaction.account_id,
+        Transaction.amount,
+        Transaction.category,
+        Transaction.description,
+        Transaction.timestamp
+    ).join(Account).filter(
+        Account.user_id.in_(user_ids),
+        Transaction.timestamp >= since
+    ).all()
+    return pd.DataFrame(
+        rows, columns=["user_id", "account_id", "amount", "category", "description", "timestamp"]
+    )
+
+def scan_users(db: Session, user_ids: List[int]) -> int:
+    """Re-detect and store recurring series for the given users. Does not commit."""
+    now = datetime.now(timezone.utc)
+    series = detect_series(_load_history(db, user_ids, now - timedelta(days=LOOKBACK_DAYS)), now)
+
+    db.query(RecurringSeries).filter(RecurringSeries.user_id.in_(user_ids)).delete()
+    db.query(RecurringScan).filter(RecurringScan.user_id.in_(user_ids)).delete()
+    if not series.empty:
+        db.add_all([
+            RecurringSeries(
+                user_id=int(row.user_id),
+                account_id=int(row.account_id),
+                key=row.key,
+                description=row.description,
+                category=row.category,
+                amount=float(row.amount),
+                period_days=float(row.period_days),
+                occurrences=int(row.occurrences),
+                last_seen=row.last_seen.to_pydatetime(),
+                next_expected=row.next_expected.to_pydatetime()
+            )
+            for row in series.itertuples(index=False)
+        ])
+    db.add_all([RecurringScan(user_id=user_id, stale=False, scanned_at=now) for user_id in user_ids])
+    return len(series)
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def get_recurring_series(db: Session, user_id: int) -> List[RecurringSeries]:
+    """Cached series for a user, rescanning first if the cache is missing or stale."""
+    scan = db.query(RecurringScan).filter(RecurringScan.user_id == user_id).first()
+    if scan is None or scan.stale or datetime.now(timezone.utc) - _as_utc(scan.scanned_at) >= MAX_SCAN_AGE:
+        scan_users(db, [user_id])
+        db.commit()
+    return db.query(RecurringSeries).filter(RecurringSeries.user_id == user_id).all()
+
+def mark_recurring_stale(db: Session, user_id: int):
+    """Force a rescan of the user's history on next read. Does not commit."""
+    db.query(RecurringScan).filter(
+        RecurringScan.user_id == user_id,
+        RecurringScan.stale.is_(False)
+    ).update({RecurringScan.stale: True}, synchronize_session=False)
+
+def note_transaction(
+    db: Session,
+    user_id: int,
+    account_id: int,
+    amount: float,
+    description: Optional[str],
+    timestamp: Optional[datetime]
+):
+    """
+    Update cached series for one new transaction. An expected occurrence of a
+    known series just advances it; anything else marks the user for rescan.
+    Does not commit.
+    """
+    timestamp = _as_utc(timestamp or datetime.now(timezone.utc))
+    series = db.query(RecurringSeries).filter(
+        RecurringSeries.user_id == user_id,
+        RecurringSeries.account_id == account_id,
+        RecurringSeries.key == series_key(description, amount)
+    ).first()
+    if series is not None:
+        _, tolerance = min(PERIODS.values(), key=lambda p: abs(p[0] - series.period_days))
+        if abs((timestamp - _as_utc(series.next_expected)).total_seconds()) <= tolerance * 86400:
+            series.last_seen = timestamp
+            series.next_expected = timestamp + timedelta(days=series.period_days)
+            series.occurrences += 1
+            return
+    mark_recurring_stale(db, user_id)
+
+def project_balances(
+    accounts: List[Account],
+    series: List[RecurringSeries],
+    start: date,
+    days: int = FORECAST_DAYS
+) -> dict:
+    """Daily projected balance per account id for `days` days from `start`, inclusive."""
+    index = {account.id: i for i, account in enumerate(accounts)}
+    deltas = np.zeros((len(accounts), days + 1))
+    start_dt = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+    for s in series:
+        row = index.get(s.account_id)
+        if row is None:
+            continue
+        # Occurrence offsets (in days from start) that fall inside the horizon
+        first = (_as_utc(s.next_expected) - start_dt).total_seconds() / 86400.0
+        if first < 0:
+            first += math.ceil(-first / s.period_days) * s.period_days
+        offsets = np.arange(first, days + 1, s.period_days).astype(int)
+        np.add.at(deltas[row], offsets, s.amount)
+    opening = np.array([a.balance for a in accounts], dtype=float).reshape(-1, 1)
+    balances = np.cumsum(deltas, axis=1) + opening
+    return {account.id: balances[i] for i, account in enumerate(accounts)}
+
+def rescan_chunk(shard_id: int, user_ids: List[int]) -> int:
+    """Process-pool entry point: rescan and commit one chunk of a shard's users."""
+    db = shard_session(shards[shard_id])
+    try:
+        scan_users(db, user_ids)
+        db.commit()
+        return len(user_ids)
+    finally:
+        db.close()
+
+def main(argv: Optional[List[str]] = None):
+    from app.batch import run_chunked
+
+    parser = argparse.ArgumentParser(description="Detect recurring transactions for every user")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    scanned = run_chunked(rescan_chunk, chunk_size=args.chunk_size, workers=args.workers)
+    print(f"scanned {scanned} users")
+
+if __name__ == "__main__":
+    main()
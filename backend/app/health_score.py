@@ -0,0 +1,215 @@
+"""
+Financial Health Score.
+
+Combines savings rate, debt-to-asset ratio, emergency-fund months, spending
+volatility and portfolio diversification into a 0-100 score. Inputs for a
+chunk of users are loaded with a few grouped queries and scored as NumPy
+arrays, so the same code serves one user on request and every user nightly:
+
+    python -m app.health_score --workers 8 --chunk-size 2000
+"""
+import argparse
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy import and_, case, extract, func
+from sqlalchemy.orm import Session
+from app.database import shard_session, shards
+from app.models import Account, AccountType, HealthScore, Portfolio, Transaction, TransactionCategory
+
+# Months of complete history used for savings, emergency-fund and volatility inputs
+HISTORY_MONTHS = 6
+# Scores older than this are recomputed on read even without input changes
+MAX_SCORE_AGE = timedelta(days=1)
+# Component weights, summing to 1
+WEIGHTS = {
+    "savings_rate": 0.25,
+    "debt_to_asset_ratio": 0.25,
+    "emergency_fund_months": 0.20,
+    "spending_volatility": 0.15,
+    "diversification": 0.15,
+}
+# Cap so users with no expenses don't get an infinite runway
+MAX_EMERGENCY_FUND_MONTHS = 120.0
+
+def component_scores(metrics: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Map raw metrics (arrays, one entry per user) to 0-100 component scores."""
+    diversification = metrics["diversification"]
+    return {
+        # 20% of income saved earns full marks
+        "savings_rate": np.clip(metrics["savings_rate"] / 0.2, 0, 1) * 100,
+        "debt_to_asset_ratio": np.clip(1 - metrics["debt_to_asset_ratio"], 0, 1) * 100,
+        # Six months of expenses in liquid accounts earns full marks
+        "emergency_fund_months": np.clip(metrics["emergency_fund_months"] / 6, 0, 1) * 100,
+        "spending_volatility": np.clip(1 - metrics["spending_volatility"], 0, 1) * 100,
+        # 1 - HHI of 0.8 (five equal holdings) earns full marks; no holdings is neutral
+        "diversification": np.where(
+            np.isnan(diversification), 50.0, np.clip(diversification / 0.8, 0, 1) * 100
+        ),
+    }
+
+def overall_score(components: Dict[str, np.ndarray]) -> np.ndarray:
+    return sum(components[name] * weight for name, weight in WEIGHTS.items())
+
+def _history_window(today: date):
+    start = date(today.year, today.month, 1)
+    months = []
+    for _ in range(HISTORY_MONTHS):
+        start = (start - timedelta(days=1)).replace(day=1)
+        months.append((start.year, start.month))
+    window_end = datetime(today.year, today.month, 1, tzinfo=timezone.utc)
+    window_start = datetime(start.year, start.month, 1, tzinfo=timezone.utc)
+    return window_start, window_end, {ym: i for i, ym in enumerate(reversed(months))}
+
+def compute_metrics(db: Session, user_ids: List[int]) -> Dict[str, np.ndarray]:
+    """Raw health metrics for the given users, aligned with the sorted user_ids."""
+    ids = np.array(sorted(user_ids), dtype=np.int64)
+    n = len(ids)
+    assets = np.zeros(n)
+    liabilities = np.zeros(n)
+    liquid = np.zeros(n)
+
+    balances = db.query(Account.user_id, Account.type, func.sum(Account.balance)).filter(
+        Account.user_id.in_(user_ids)
+    ).group_by(Account.user_id, Account.type).all()
+    if balances:
+        rows = np.searchsorted(ids, [b[0] for b in balances])
+        types = [b[1] for b in balances]
+        amounts = np.array([b[2] or 0.0 for b in balances])
+        is_loan = np.array([t == AccountType.LOAN for t in types])
+        is_liquid = np.array([t in (AccountType.CHECKING, AccountType.SAVINGS) for t in types])
+        np.add.at(liabilities, rows[is_loan], amounts[is_loan])
+        np.add.at(assets, rows[~is_loan], amounts[~is_loan])
+        np.add.at(liquid, rows[is_liquid], amounts[is_liquid])
+
+    window_start, window_end, month_index = _history_window(datetime.now(timezone.utc).date())
+    income = np.zeros((n, HISTORY_MONTHS))
+    expenses = np.zeros((n, HISTORY_MONTHS))
+    year = extract("year", Transaction.timestamp)
+    month = extract("month", Transaction.timestamp)
+    monthly = db.query(
+        Account.user_id,
+        year,
+        month,
+        func.sum(case((Transaction.category == TransactionCategory.SALARY, Transaction.amount), else_=0.0)),
+        func.sum(case(
+            (and_(Transaction.category != TransactionCategory.SALARY, Transaction.amount < 0), -Transaction.amount),
+            else_=0.0
+        ))
+    ).join(Account).filter(
+        Account.user_id.in_(user_ids),
+        Transaction.timestamp >= window_start,
+        Transaction.timestamp < window_end
+    ).group_by(Account.user_id, year, month).all()
+    monthly = [m for m in monthly if (int(m[1]), int(m[2])) in month_index]
+    if monthly:
+        rows = np.searchsorted(ids, [m[0] for m in monthly])
+        cols = np.array([month_index[(int(m[1]), int(m[2]))] for m in monthly])
+        income[rows, cols] = [abs(m[3] or 0.0) for m in monthly]
+        expenses[rows, cols] = [m[4] or 0.0 for m in monthly]
+
+    diversification = np.full(n, np.nan)
+    holdings = db.query(
+        Portfolio.user_id,
+        Portfolio.ticker_symbol,
+        func.sum(Portfolio.shares_owned * Portfolio.cost_basis)
+    ).filter(Portfolio.user_id.in_(user_ids)).group_by(Portfolio.user_id, Portfolio.ticker_symbol).all()
+    if holdings:
+        rows = np.searchsorted(ids, [h[0] for h in holdings])
+        values = np.array([max(h[2] or 0.0, 0.0) for h in holdings])
+        totals = np.zeros(n)
+        np.add.at(totals, rows, values)
+        weights = np.divide(values, totals[rows], out=np.zeros_like(values), where=totals[rows] > 0)
+        hhi = np.zeros(n)
+        np.add.at(hhi, rows, weights ** 2)
+        has_holdings = totals > 0
+        diversification[has_holdings] = 1 - hhi[has_holdings]
+
+    total_income = income.sum(axis=1)
+    total_expenses = expenses.sum(axis=1)
+    mean_expenses = expenses.mean(axis=1)
+    savings_rate = np.divide(
+        total_income - total_expenses, total_income,
+        out=np.zeros(n), where=total_income > 0
+    )
+    debt_to_asset_ratio = np.divide(
+        liabilities, assets,
+        out=np.where(liabilities > 0, 1.0, 0.0), where=assets > 0
+    )
+    emergency_fund_months = np.divide(
+        np.maximum(liquid, 0), mean_expenses,
+        out=np.where(liquid > 0, MAX_EMERGENCY_FUND_MONTHS, 0.0), where=mean_expenses > 0
+    )
+    spending_volatility = np.divide(
+        expenses.std(axis=1), mean_expenses,
+        out=np.zeros(n), where=mean_expenses > 0
+    )
+    return {
+        "user_id": ids,
+        "savings_rate": savings_rate,
+        "debt_to_asset_ratio": debt_to_asset_ratio,
+        "emergency_fund_months": np.minimum(emergency_fund_months, MAX_EMERGENCY_FUND_MONTHS),
+        "spending_volatility": spending_volatility,
+        "diversification": diversification,
+    }
+
+def score_users(db: Session, user_ids: List[int]) -> List[HealthScore]:
+    """Compute and store scores for the given users. Does not commit."""
+    metrics = compute_metrics(db, user_ids)
+    scores = overall_score(component_scores(metrics))
+    now = datetime.now(timezone.utc)
+    db.query(HealthScore).filter(HealthScore.user_id.in_(user_ids)).delete()
+    rows = []
+    for i, user_id in enumerate(metrics["user_id"].tolist()):
+        diversification = metrics["diversification"][i]
+        rows.append(HealthScore(
+            user_id=user_id,
+            score=float(scores[i]),
+            savings_rate=float(metrics["savings_rate"][i]),
+            debt_to_asset_ratio=float(metrics["debt_to_asset_ratio"][i]),
+            emergency_fund_months=float(metrics["emergency_fund_months"][i]),
+            spending_volatility=float(metrics["spending_volatility"][i]),
+            diversification=None if np.isnan(diversification) else float(diversification),
+            stale=False,
+            computed_at=now
+        ))
+    db.add_all(rows)
+    return rows
+
+def is_fresh(health_score: Optional[HealthScore]) -> bool:
+    if health_score is None or health_score.stale:
+        return False
+    computed_at = health_score.computed_at
+    if computed_at.tzinfo is None:
+        computed_at = computed_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - computed_at < MAX_SCORE_AGE
+
+def mark_health_score_stale(db: Session, user_id: int):
+    """Flag a user's stored score for recomputation on next read. Does not commit."""
+    db.query(HealthScore).filter(
+        HealthScore.user_id == user_id,
+        HealthScore.stale.is_(False)
+    ).update({HealthScore.stale: True}, synchronize_session=False)
+
+def rescore_chunk(shard_id: int, user_ids: List[int]) -> int:
+    """Process-pool entry point: score and commit one chunk of a shard's users."""
+    db = shard_session(shards[shard_id])
+    try:
+        rows = score_users(db, user_ids)
+        db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
+def main(argv: Optional[List[str]] = None):
+    from app.batch import run_chunked
+
+    parser = argparse.ArgumentParser(description="Recompute Financial Health Scores for every user")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    scored = run_chunked(rescore_chunk, chunk_size=args.chunk_size, workers=args.workers)
+    print(f"scored {scored} users")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Purchase lots and consolidated positions.
+
+Each purchase is stored as a lot in portfolio_lots. The user's position in a
+ticker (one portfolios row) holds total shares and weighted average cost and
+is updated with one upsert per ticker per write, so valuation reads one row
+per distinct ticker. Databases created before lots existed get their lots and
+the unique (user, ticker) index at startup, unless they have several rows per
+ticker; until those are merged (once, on every shard) with
+
+    python -m app.holdings consolidate
+
+positions are updated with a locking read instead of the upsert.
+"""
+import argparse
+import io
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import pandas as pd
+from sqlalchemy import exists, func, insert, inspect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app.models import Portfolio, PortfolioLot
+
+logger = logging.getLogger(__name__)
+
+MAX_IMPORT_ROWS = 10000
+# OWASP: Input validation - exchange suffixes and index/FX symbols (BRK.B, ^GSPC, EURUSD=X)
+TICKER_PATTERN = re.compile(r"^[A-Z0-9.\-^=]{1,15}$")
+
+# (ticker, shares, price per share, purchased_at or None for now)
+Trade = Tuple[str, float, float, Optional[datetime]]
+
+def normalize_ticker(ticker: str) -> str:
+    return ticker.strip().upper()
+
+# Databases known to have the unique position index; it is never dropped once added
+_indexed = set()
+
+def has_position_index(db: Session) -> bool:
+    bind = db.get_bind()
+    url = bind.engine.url
+    if url in _indexed:
+        return True
+    names = {index["name"] for index in inspect(db.connection()).get_indexes(Portfolio.__tablename__)}
+    if not any(index.name in names for index in Portfolio.__table__.indexes if index.unique):
+        return False
+    _indexed.add(url)
+    return True
+
+def upsert_position(db: Session, user_id: int, ticker: str, shares: float, cost: float):
+    """Add `shares` bought for a total of `cost` to a position, creating it if needed."""
+    dialect = db.get_bind().dialect.name
+    # ON CONFLICT needs the unique index, which older databases only get from consolidation
+    if dialect in ("postgresql", "sqlite") and has_position_index(db):
+        insert_ = pg_insert if dialect == "postgresql" else sqlite_insert
+        table = Portfolio.__table__
+        stmt = insert_(Portfolio).values(
+            user_id=user_id, ticker_symbol=ticker, shares_owned=shares, cost_basis=cost / shares
+        )
+        new_shares = table.c.shares_owned + stmt.excluded.shares_owned
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "ticker_symbol"],
+            set_={
+                # SET expressions see the old row, so both use the pre-update shares
+                "cost_basis": (
+                    table.c.shares_owned * table.c.cost_basis
+                    + stmt.excluded.shares_owned * stmt.excluded.cost_basis
+                ) / new_shares,
+                "shares_owned": new_shares,
+                "updated_at": func.now(),
+            }
+        )
+        db.execute(stmt)
+        return
+
+    position = db.query(Portfolio).filter(
+        Portfolio.user_id == user_id,
+        Portfolio.ticker_symbol == ticker
+    ).with_for_update().first()
+    if position is None:
+        db.add(Portfolio(user_id=user_id, ticker_symbol=ticker, shares_owned=shares, cost_basis=cost / shares))
+    else:
+        total = position.shares_owned + shares
+        position.cost_basis = (position.shares_owned * position.cost_basis + cost) / total
+        position.shares_owned = total
+    db.flush()
+
+def add_lots(db: Session, user_id: int, trades: Sequence[Trade]) -> List[str]:
+    """
+    Record purchase lots and fold them into the user's positions, one upsert
+    per distinct ticker. Returns the affected tickers. Does not commit.
+    """
+    now = datetime.now(timezone.utc)
+    db.execute(insert(PortfolioLot), [
+        {
+            "user_id": user_id,
+            "ticker_symbol": ticker,
+            "shares": shares,
+            "price": price,
+            "purchased_at": purchased_at or now,
+        }
+        for ticker, shares, price, purchased_at in trades
+    ])
+    totals: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0])
+    for ticker, shares, price, _ in trades:
+        totals[ticker][0] += shares
+        totals[ticker][1] += shares * price
+    for ticker, (shares, cost) in totals.items():
+        upsert_position(db, user_id, ticker, shares, cost)
+    return list(totals)
+
+def read_trades(contents: bytes, filename: Optional[str]) -> pd.DataFrame:
+    """Parse an uploaded CSV, or a JSON array of trade objects when the file name ends in .json."""
+    if filename and filename.lower().endswith(".json"):
+        return pd.read_json(io.BytesIO(contents), orient="records", dtype=False)
+    return pd.read_csv(io.BytesIO(contents))
+
+def validate_trades(
+    df: pd.DataFrame,
+    get_prices: Callable[[Iterable[str]], Dict[str, float]]
+) -> Tuple[List[Trade], List[str]]:
+    """
+    Check every row of a trades frame (columns ticker, shares, price and
+    optionally date) and look up all distinct tickers in one pass.
+    Returns the parsed trades and a list of errors; trades are only usable
+    when there are no errors.
+    """
+    df = df.rename(columns=lambda c: str(c).strip().lower()).rename(
+        columns={"ticker_symbol": "ticker", "purchased_at": "date"}
+    )
+    missing = [c for c in ("ticker", "shares", "price") if c not in df.columns]
+    if missing:
+        return [], [f"Trades must contain columns: ticker, shares, price (missing {', '.join(missing)})"]
+    if len(df) > MAX_IMPORT_ROWS:
+        return [], [f"At most {MAX_IMPORT_ROWS} trades can be imported at once"]
+
+    tickers = df["ticker"].astype("string").str.strip().str.upper()
+    shares = pd.to_numeric(df["shares"], errors="coerce")
+    prices = pd.to_numeric(df["price"], errors="coerce")
+    if "date" in df.columns:
+        dates = pd.to_datetime(df["date"], errors="coerce", utc=True, format="mixed")
+        bad_dates = df["date"].notna() & dates.isna()
+    else:
+        dates = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns, UTC]")
+        bad_dates = pd.Series(False, index=df.index)
+
+    errors = []
+    bad_tickers = tickers.isna() | ~tickers.fillna("").str.fullmatch(TICKER_PATTERN.pattern)
+    checks = [
+        (bad_tickers, "invalid ticker"),
+        (shares.isna() | (shares <= 0), "shares must be a positive number"),
+        (prices.isna() | (prices < 0), "price must be a non-negative number"),
+        (bad_dates, "unreadable date"),
+    ]
+    for mask, message in checks:
+        for row in df.index[mask.to_numpy()][:20]:
+            errors.append(f"Row {row + 1}: {message}")
+
+    known = get_prices(set(tickers[~bad_tickers]))
+    unknown = tickers[~bad_tickers & ~tickers.isin(list(known))]
+    for ticker, rows in unknown.groupby(unknown, sort=True).groups.items():
+        row_list = ", ".join(str(r + 1) for r in list(rows)[:10])
+        errors.append(f"Unknown ticker {ticker} (rows {row_list})")
+    if errors:
+        return [], errors
+
+    trades = [
+        (ticker, float(n), float(price), None if pd.isna(ts) else ts.to_pydatetime())
+        for ticker, n, price, ts in zip(tickers, shares, prices, dates)
+    ]
+    return trades, []
+
+def _ticker_groups_to_merge(db: Session):
+    ticker = func.upper(func.trim(Portfolio.ticker_symbol))
+    return db.query(Portfolio.user_id, ticker).group_by(Portfolio.user_id, ticker).having(
+        (func.count() > 1) | (func.max(Portfolio.ticker_symbol) != ticker)
+    )
+
+def ensure_position_index(db: Session) -> bool:
+    """
+    Backfill lots and add the unique position index on a database upgraded
+    from before lots existed, unless duplicate positions need merging first.
+    Returns whether the index exists. Commits.
+    """
+    if has_position_index(db):
+        return True
+    if _ticker_groups_to_merge(db).first() is not None:
+        logger.warning("Duplicate positions found; run `python -m app.holdings consolidate`")
+        return False
+    consolidate_positions(db)
+    db.commit()
+    return True
+
+def consolidate_positions(db: Session) -> int:
+    """
+    Give legacy positions a lot for each original row, merge rows for the
+    same (user, ticker) into one and add the unique index. Returns the number
+    of rows merged away. Does not commit.
+    """
+    ticker = func.upper(func.trim(Portfolio.ticker_symbol))
+    legacy = db.query(Portfolio).filter(~exists().where(
+        PortfolioLot.user_id == Portfolio.user_id,
+        PortfolioLot.ticker_symbol == ticker
+    )).all()
+    if legacy:
+        db.execute(insert(PortfolioLot), [
+            {
+                "user_id": p.user_id,
+                "ticker_symbol": normalize_ticker(p.ticker_symbol),
+                "shares": p.shares_owned,
+                "price": p.cost_basis,
+                "purchased_at": p.created_at,
+            }
+            for p in legacy
+        ])
+
+    groups = _ticker_groups_to_merge(db).all()
+    merged = 0
+    for user_id, symbol in groups:
+        rows = db.query(Portfolio).filter(
+            Portfolio.user_id == user_id,
+            ticker == symbol
+        ).order_by(Portfolio.id).all()
+        keep, duplicates = rows[0], rows[1:]
+        shares = sum(r.shares_owned for r in rows)
+        cost = sum(r.shares_owned * r.cost_basis for r in rows)
+        keep.ticker_symbol = symbol
+        keep.cost_basis = cost / shares if shares else keep.cost_basis
+        keep.shares_owned = shares
+        for duplicate in duplicates:
+            db.delete(duplicate)
+        merged += len(duplicates)
+    db.flush()
+
+    for index in Portfolio.__table__.indexes:
+        if index.unique:
+            index.create(db.connection(), checkfirst=True)
+    return merged
+
+def main(argv: Optional[List[str]] = None):
+    from app.database import shard_session, shards
+
+    parser = argparse.ArgumentParser(description="Maintain consolidated holdings")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("consolidate", help="merge duplicate positions and backfill purchase lots")
+    parser.parse_args(argv)
+
+    for shard in shards:
+        db = shard_session(shard)
+        try:
+            merged = consolidate_positions(db)
+            db.commit()
+        finally:
+            db.close()
+        print(f"shard {shard.id}: merged {merged} duplicate positions")
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,62 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
-from app.routers import auth, dashboard, transactions, investments, accounts
-from app.middleware import SecurityHeadersMiddleware, RateLimitMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from app.database import engine, Base, SHARDING_ENABLED, TRANSACTIONS_PARTITIONED, shard_session, shards
+from app.holdings import ensure_position_index
+from app.routers import auth, dashboard, transactions, investments, accounts, budgets
+from app.middleware import SecurityHeadersMiddleware, RateLimitMiddleware, ReadAfterWriteMiddleware
+from app.singleflight import single_flight
+from app.warmup import warm_up
+import asyncio
 import os
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+def init_db():
+    """
+    Create missing tables (and partitions) on every shard and the shard
+    directory, and add indexes create_all doesn't add to existing tables.
+    """
+    for shard in shards:
+        Base.metadata.create_all(bind=shard.engine)
+        db = shard_session(shard)
+        try:
+            ensure_position_index(db)
+        finally:
+            db.close()
+        if TRANSACTIONS_PARTITIONED:
+            from app.partitioning import ensure_transaction_partitions
+            ensure_transaction_partitions(shard.engine)
+    if SHARDING_ENABLED:
+        from app.sharding import DirectoryBase
+        DirectoryBase.metadata.create_all(bind=engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # run.py --production initializes once in the parent instead of racing in every worker
+    if not os.getenv("FINPULSE_DB_INITIALIZED"):
+        await asyncio.to_thread(init_db)
+    # Uvicorn only starts accepting connections on this worker once start-up returns
+    await asyncio.to_thread(warm_up)
+    yield
+    # Stop shared price pollers so workers exit cleanly
+    await investments.price_hub.shutdown()
 
 app = FastAPI(
     title="FinPulse API",
     description="Financial Health Dashboard API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Compress larger responses for clients that send Accept-Encoding: gzip (SSE is left uncompressed)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 # OWASP: Security headers middleware (add first to apply to all responses)
 app.add_middleware(SecurityHeadersMiddleware)
 
+# Keep a client's reads on the primary right after it writes, across workers
+app.add_middleware(ReadAfterWriteMiddleware)
+
 # OWASP: Rate limiting middleware (protect against brute force)
 app.add_middleware(RateLimitMiddleware, requests_per_minute=60)
 
@@ -37,6 +77,7 @@ app.include_router(dashboard.router, prefix="/api/dashboard", tags=["dashboard"]
 app.include_router(accounts.router, prefix="/api/accounts", tags=["accounts"])
 app.include_router(transactions.router, prefix="/api/transactions", tags=["transactions"])
 app.include_router(investments.router, prefix="/api/investments", tags=["investments"])
+app.include_router(budgets.router, prefix="/api/budgets", tags=["budgets"])
 
 @app.get("/")
 async def root():
@@ -46,3 +87,11 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "single_flight": single_flight.stats(),
+        "price_hub": investments.price_hub.stats(),
+        "price_cache": investments.price_cache.stats(),
+    }
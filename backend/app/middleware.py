@@ -3,7 +3,16 @@ Security middleware for OWASP best practices
 """
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
+from app.database import READ_AFTER_WRITE_SECONDS
+from app.security import SECRET_KEY
+import hashlib
+import hmac
+import math
+import os
 import time
+from typing import Optional
+
+LAST_WRITE_COOKIE = "finpulse_last_write"
 
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
     """
@@ -82,3 +91,42 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         response = await call_next(request)
         return response
 
+
+
+def _sign_last_write(timestamp: float) -> str:
+    value = f"{timestamp:.3f}"
+    signature = hmac.new(SECRET_KEY.encode(), value.encode(), hashlib.sha256).hexdigest()
+    return f"{value}.{signature}"
+
+def _verify_last_write(cookie: Optional[str]) -> Optional[float]:
+    value, _, signature = (cookie or "").rpartition(".")
+    expected = hmac.new(SECRET_KEY.encode(), value.encode(), hashlib.sha256).hexdigest()
+    if not value or not hmac.compare_digest(signature, expected):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+class ReadAfterWriteMiddleware(BaseHTTPMiddleware):
+    """
+    Carry a client's last write time in a short-lived signed cookie, so its
+    reads stay on the primary whichever worker serves them.
+    """
+    async def dispatch(self, request: Request, call_next):
+        received = _verify_last_write(request.cookies.get(LAST_WRITE_COOKIE))
+        if received is not None:
+            request.state.last_write_at = received
+        response = await call_next(request)
+        # Set by the session's after_commit hook when this request wrote
+        last_write_at = getattr(request.state, "last_write_at", None)
+        if last_write_at is not None and last_write_at != received:
+            response.set_cookie(
+                LAST_WRITE_COOKIE,
+                _sign_last_write(last_write_at),
+                max_age=math.ceil(READ_AFTER_WRITE_SECONDS),
+                httponly=True,  # OWASP: Not readable by scripts
+                secure=os.getenv("ENVIRONMENT") == "production",
+                samesite="lax",
+            )
+        return response
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Boolean, Column, Integer, String, Float, Date, DateTime, ForeignKey, Index, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from app.database import Base
+from app.database import Base, TRANSACTIONS_PARTITIONED
 import enum
 
 class AccountType(str, enum.Enum):
@@ -33,6 +33,7 @@ class User(Base):
     
     accounts = relationship("Account", back_populates="user", cascade="all, delete-orphan")
     portfolios = relationship("Portfolio", back_populates="user", cascade="all, delete-orphan")
+    refresh_tokens = relationship("RefreshToken", back_populates="user", cascade="all, delete-orphan")
 
 class Account(Base):
     __tablename__ = "accounts"
@@ -49,23 +50,39 @@ class Account(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Hot queries are "this user's accounts, recent window"
+        Index("ix_transactions_account_id_timestamp", "account_id", "timestamp"),
+        # Opt-in monthly partitions, maintained by app/partitioning.py
+        {"postgresql_partition_by": "RANGE (timestamp)"} if TRANSACTIONS_PARTITIONED else {},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
     amount = Column(Float, nullable=False)
     category = Column(SQLEnum(TransactionCategory), nullable=False)
     description = Column(String)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Postgres requires the partition key in the primary key of a partitioned table
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False,
+                       primary_key=TRANSACTIONS_PARTITIONED)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     account = relationship("Account", back_populates="transactions")
+    
+    # Ids stay unique across partitions, so the ORM identity remains id alone
+    __mapper_args__ = {"primary_key": [id]}
 
 class Portfolio(Base):
+    """A position: one row per (user, ticker), maintained from its purchase lots."""
     __tablename__ = "portfolios"
+    __table_args__ = (
+        # A unique index rather than a constraint so `python -m app.holdings consolidate` can add it to existing tables
+        Index("uq_portfolios_user_ticker", "user_id", "ticker_symbol", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    ticker_symbol = Column(String, nullable=False)
+    ticker_symbol = Column(String, nullable=False)  # Upper case
     shares_owned = Column(Float, nullable=False)
     cost_basis = Column(Float, nullable=False)  # Average cost per share
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -73,3 +90,108 @@ class Portfolio(Base):
     
     user = relationship("User", back_populates="portfolios")
 
+class PortfolioLot(Base):
+    """One purchase. Positions in portfolios are the running totals of these."""
+    __tablename__ = "portfolio_lots"
+    __table_args__ = (
+        Index("ix_portfolio_lots_user_id_ticker_symbol", "user_id", "ticker_symbol"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    ticker_symbol = Column(String, nullable=False)
+    shares = Column(Float, nullable=False)
+    price = Column(Float, nullable=False)  # Cost per share
+    purchased_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    token_hash = Column(String, unique=True, index=True, nullable=False)  # HMAC of the opaque token
+    family_id = Column(String, index=True, nullable=False)  # Shared by every rotation of one login
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True))
+    replaced_by_id = Column(Integer, ForeignKey("refresh_tokens.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    user = relationship("User", back_populates="refresh_tokens")
+
+class Budget(Base):
+    __tablename__ = "budgets"
+    __table_args__ = (UniqueConstraint("user_id", "category", name="uq_budgets_user_category"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    category = Column(SQLEnum(TransactionCategory), nullable=False)
+    monthly_limit = Column(Float, nullable=False)
+    alert_threshold = Column(Float, nullable=False, default=0.8)  # Fraction of the limit
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class BudgetCounter(Base):
+    """Running spend per (user, category, month), maintained on every transaction write."""
+    __tablename__ = "budget_counters"
+    __table_args__ = (
+        UniqueConstraint("user_id", "category", "month", name="uq_budget_counters_user_category_month"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    category = Column(SQLEnum(TransactionCategory), nullable=False)
+    month = Column(Date, nullable=False)  # First day of the month (UTC)
+    spent = Column(Float, nullable=False, default=0.0)
+
+class BudgetAlert(Base):
+    """Outbox of threshold crossings, written in the same transaction as the spend."""
+    __tablename__ = "budget_alerts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    category = Column(SQLEnum(TransactionCategory), nullable=False)
+    month = Column(Date, nullable=False)
+    threshold = Column(Float, nullable=False)
+    spent = Column(Float, nullable=False)
+    monthly_limit = Column(Float, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class HealthScore(Base):
+    """Latest Financial Health Score per user; marked stale when its inputs change."""
+    __tablename__ = "health_scores"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    score = Column(Float, nullable=False)
+    savings_rate = Column(Float, nullable=False)
+    debt_to_asset_ratio = Column(Float, nullable=False)
+    emergency_fund_months = Column(Float, nullable=False)
+    spending_volatility = Column(Float, nullable=False)
+    diversification = Column(Float)  # None when the user holds no investments
+    stale = Column(Boolean, nullable=False, default=False)
+    computed_at = Column(DateTime(timezone=True), nullable=False)
+
+class RecurringSeries(Base):
+    """A detected recurring transaction (rent, salary, subscription) on one account."""
+    __tablename__ = "recurring_series"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
+    key = Column(String, nullable=False)  # Normalized description + amount band
+    description = Column(String)
+    category = Column(SQLEnum(TransactionCategory), nullable=False)
+    amount = Column(Float, nullable=False)  # Typical (median) amount
+    period_days = Column(Float, nullable=False)
+    occurrences = Column(Integer, nullable=False)
+    last_seen = Column(DateTime(timezone=True), nullable=False)
+    next_expected = Column(DateTime(timezone=True), nullable=False)
+
+class RecurringScan(Base):
+    """When a user's history was last scanned for recurring series."""
+    __tablename__ = "recurring_scans"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    stale = Column(Boolean, nullable=False, default=False)
+    scanned_at = Column(DateTime(timezone=True), nullable=False)
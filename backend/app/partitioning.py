@@ -0,0 +1,248 @@
+"""
+Monthly range partitions for the transactions table (PostgreSQL).
+
+Enabled with TRANSACTIONS_PARTITIONED=1 on a fresh database. Partitions are
+created ahead of time on startup and by the `create-partitions` command, and
+on demand for the months of inserted rows, so there is no catch-all partition.
+The `archive` command detaches months older than the horizon into compressed
+Parquet files that the transaction export still reads.
+
+    python -m app.partitioning create-partitions --months-ahead 3
+    python -m app.partitioning archive --horizon-months 24
+    python -m app.partitioning check-pruning --days 30
+"""
+import argparse
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import pandas as pd
+from sqlalchemy import text
+from app.database import TRANSACTIONS_PARTITIONED
+from app.models import TransactionCategory
+
+TRANSACTIONS_ARCHIVE_DIR = os.getenv("TRANSACTIONS_ARCHIVE_DIR", "archive/transactions")
+TRANSACTIONS_ARCHIVE_HORIZON_MONTHS = int(os.getenv("TRANSACTIONS_ARCHIVE_HORIZON_MONTHS", "24"))
+
+_PARTITION_NAME = re.compile(r"^transactions_y(\d{4})m(\d{2})$")
+_PARTITION_LOCK_KEY = 7_402_113  # pg_advisory_xact_lock key for partition DDL
+
+# Months known to have a partition, per database
+_known_partitions: Dict[object, Set[date]] = {}
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"transactions_y{month.year:04d}m{month.month:02d}"
+
+def archive_path(month: date, archive_dir: str = TRANSACTIONS_ARCHIVE_DIR) -> str:
+    return os.path.join(archive_dir, f"transactions_{month.year:04d}_{month.month:02d}.parquet")
+
+def shard_archive_dir(shard_id: int, archive_dir: str = TRANSACTIONS_ARCHIVE_DIR) -> str:
+    # Shard 0 keeps the unsharded layout; account ids are only unique within a shard
+    return archive_dir if shard_id == 0 else os.path.join(archive_dir, f"shard_{shard_id}")
+
+def _month_of(timestamp: Optional[datetime]) -> date:
+    # Naive timestamps are stored as UTC; rows without one get now() on insert
+    if timestamp is None or pd.isna(timestamp):
+        timestamp = datetime.now(timezone.utc)
+    elif timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.date().replace(day=1)
+
+def _create_partition(conn, month: date) -> bool:
+    name = partition_name(month)
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+        return False
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF transactions "
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+        f"TO ('{_add_months(month, 1).isoformat()} 00:00:00+00')"
+    ))
+    return True
+
+def _lock_partitions(conn):
+    # Serializes partition DDL across workers and the maintenance commands
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _PARTITION_LOCK_KEY})
+
+def _retire_default_partition(conn) -> List[str]:
+    """
+    Move rows out of the catch-all partition that earlier releases created into
+    monthly partitions, then drop it.
+    """
+    if not conn.execute(text("SELECT to_regclass('transactions_default')")).scalar():
+        return []
+    conn.execute(text("ALTER TABLE transactions DETACH PARTITION transactions_default"))
+    months = conn.execute(text(
+        "SELECT DISTINCT date_trunc('month', timestamp AT TIME ZONE 'UTC')::date FROM transactions_default"
+    )).scalars().all()
+    created = [partition_name(month) for month in sorted(months) if _create_partition(conn, month)]
+    conn.execute(text("INSERT INTO transactions SELECT * FROM transactions_default"))
+    conn.execute(text("DROP TABLE transactions_default"))
+    return created
+
+def ensure_transaction_partitions(bind, months_ahead: int = 3, months_back: int = 0) -> List[str]:
+    """Create missing monthly partitions around the current month."""
+    this_month = datetime.now(timezone.utc).date().replace(day=1)
+    with bind.begin() as conn:
+        _lock_partitions(conn)
+        created = _retire_default_partition(conn)
+        for offset in range(-months_back, months_ahead + 1):
+            month = _add_months(this_month, offset)
+            if _create_partition(conn, month):
+                created.append(partition_name(month))
+    return created
+
+def ensure_partitions_for(conn, timestamps: Iterable[Optional[datetime]]) -> List[str]:
+    """
+    Create the monthly partitions that rows with these timestamps will be
+    inserted into, inside the caller's transaction. Lets imports of old or
+    future-dated transactions succeed without a catch-all partition.
+    """
+    if not TRANSACTIONS_PARTITIONED or conn.dialect.name != "postgresql":
+        return []
+    known = _known_partitions.setdefault(conn.engine.url, set())
+    months = {_month_of(ts) for ts in timestamps} - known
+    if not months:
+        return []
+    _lock_partitions(conn)
+    created = []
+    for month in sorted(months):
+        if _create_partition(conn, month):
+            created.append(partition_name(month))
+        else:
+            # Only committed partitions are remembered; ours may still roll back
+            known.add(month)
+    return created
+
+def list_transaction_partitions(bind) -> List[Tuple[str, date]]:
+    """Attached monthly partitions as (name, first day of month), oldest first."""
+    with bind.connect() as conn:
+        names = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'transactions'"
+        )).scalars().all()
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+def archive_transaction_partitions(
+    bind,
+    horizon_months: int = TRANSACTIONS_ARCHIVE_HORIZON_MONTHS,
+    archive_dir: str = TRANSACTIONS_ARCHIVE_DIR
+) -> List[str]:
+    """
+    Write each partition older than the horizon to Parquet (zstd), then detach
+    and drop it. The file is fully written before the partition is dropped.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Archiving transactions requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("account_id", pa.int64()),
+        ("amount", pa.float64()),
+        ("category", pa.string()),
+        ("description", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+    ])
+    cutoff = _add_months(datetime.now(timezone.utc).date().replace(day=1), -horizon_months)
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    for name, month in list_transaction_partitions(bind):
+        if month >= cutoff:
+            break
+        path = archive_path(month, archive_dir)
+        part = 1
+        while os.path.exists(path):
+            # Rows inserted for an already archived month get a second file
+            part += 1
+            path = archive_path(month, archive_dir)[:-len(".parquet")] + f"_{part}.parquet"
+        tmp_path = path + ".tmp"
+        with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer, bind.connect() as conn:
+            # Stream in chunks so large months never sit in memory at once
+            query = text(f"SELECT {', '.join(schema.names)} FROM {name}")
+            for chunk in pd.read_sql(query, conn, chunksize=100_000):
+                # Explicit schema: a chunk whose description is all NULL must not infer type null
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        os.replace(tmp_path, path)
+        with bind.begin() as conn:
+            conn.execute(text(f"ALTER TABLE transactions DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+        archived.append(path)
+    return archived
+
+def read_archived_transactions(
+    account_ids: List[int],
+    archive_dir: str = TRANSACTIONS_ARCHIVE_DIR
+) -> pd.DataFrame:
+    """Archived transactions for the given accounts, with categories as enum values."""
+    columns = ["account_id", "amount", "category", "description", "timestamp"]
+    if not account_ids or not os.path.isdir(archive_dir):
+        return pd.DataFrame(columns=columns)
+    files = sorted(
+        os.path.join(archive_dir, f) for f in os.listdir(archive_dir) if f.endswith(".parquet")
+    )
+    if not files:
+        return pd.DataFrame(columns=columns)
+    frames = [
+        pd.read_parquet(f, columns=columns, filters=[("account_id", "in", list(account_ids))])
+        for f in files
+    ]
+    df = pd.concat(frames, ignore_index=True)
+    # Postgres stores the enum member name; the API speaks values
+    df["category"] = df["category"].map(
+        lambda c: TransactionCategory[c].value if c in TransactionCategory.__members__ else c
+    )
+    return df
+
+def scanned_partitions(bind, since: datetime) -> List[str]:
+    """Partitions the planner touches for a recent-window query (pruning check)."""
+    with bind.connect() as conn:
+        plan = conn.execute(
+            text("EXPLAIN SELECT sum(amount) FROM transactions WHERE timestamp >= :since"),
+            {"since": since}
+        ).scalars().all()
+    return sorted(set(re.findall(r"on (transactions_\w+)", "\n".join(plan))))
+
+def main(argv: Optional[List[str]] = None):
+    from app.database import shards
+
+    parser = argparse.ArgumentParser(description="Maintain transactions partitions on every shard")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create-partitions", help="create upcoming monthly partitions")
+    create.add_argument("--months-ahead", type=int, default=3)
+    create.add_argument("--months-back", type=int, default=0)
+    archive = commands.add_parser("archive", help="archive partitions older than the horizon to Parquet")
+    archive.add_argument("--horizon-months", type=int, default=TRANSACTIONS_ARCHIVE_HORIZON_MONTHS)
+    archive.add_argument("--archive-dir", default=TRANSACTIONS_ARCHIVE_DIR)
+    pruning = commands.add_parser("check-pruning", help="show partitions scanned for a recent window")
+    pruning.add_argument("--days", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    for shard in shards:
+        if args.command == "create-partitions":
+            for name in ensure_transaction_partitions(shard.engine, args.months_ahead, args.months_back):
+                print(f"shard {shard.id}: created {name}")
+        elif args.command == "archive":
+            archive_dir = shard_archive_dir(shard.id, args.archive_dir)
+            for path in archive_transaction_partitions(shard.engine, args.horizon_months, archive_dir):
+                print(f"shard {shard.id}: archived {path}")
+        else:
+            since = datetime.now(timezone.utc) - timedelta(days=args.days)
+            for name in scanned_partitions(shard.engine, since):
+                print(f"shard {shard.id}: {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Shared live price polling for streaming endpoints, and a short-lived price
+cache for request/response lookups.
+
+One poller task runs per distinct ticker, no matter how many connections
+are watching it, so upstream market-data calls scale with tickers, not users.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PriceSubscription:
+    """
+    Per-connection view of the hub. Holds only the latest price per ticker,
+    so a slow consumer skips intermediate updates instead of queueing them.
+    """
+    def __init__(self, hub: "PriceHub", tickers: Set[str]):
+        self.hub = hub
+        self.tickers = tickers
+        self._pending: Dict[str, float] = {}
+        self._ready = asyncio.Event()
+
+    def offer(self, ticker: str, price: float):
+        # Backpressure: overwrite any value the consumer has not read yet
+        self._pending[ticker] = price
+        self._ready.set()
+
+    async def next_prices(self) -> Dict[str, float]:
+        """Wait for at least one update and return all latest pending prices."""
+        await self._ready.wait()
+        self._ready.clear()
+        prices, self._pending = self._pending, {}
+        return prices
+
+    async def close(self):
+        await self.hub.unsubscribe(self)
+
+
+class PriceHub:
+    """
+    Ref-counted registry of ticker pollers shared by every connection.
+    """
+    def __init__(self, fetch_price: Callable[[str], float], refresh_seconds: float = 15.0):
+        self.fetch_price = fetch_price
+        self.refresh_seconds = refresh_seconds
+        self._subscribers: Dict[str, Set[PriceSubscription]] = {}
+        self._pollers: Dict[str, asyncio.Task] = {}
+        self._prices: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+        self.upstream_calls = 0
+
+    def latest(self, ticker: str) -> Optional[float]:
+        return self._prices.get(ticker)
+
+    async def subscribe(self, tickers: Iterable[str]) -> PriceSubscription:
+        subscription = PriceSubscription(self, {t.upper() for t in tickers})
+        async with self._lock:
+            for ticker in subscription.tickers:
+                self._subscribers.setdefault(ticker, set()).add(subscription)
+                if ticker not in self._pollers:
+                    self._pollers[ticker] = asyncio.create_task(self._poll(ticker))
+                elif ticker in self._prices:
+                    # Late joiners get the cached price immediately
+                    subscription.offer(ticker, self._prices[ticker])
+        return subscription
+
+    async def unsubscribe(self, subscription: PriceSubscription):
+        async with self._lock:
+            for ticker in subscription.tickers:
+                subscribers = self._subscribers.get(ticker)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    # Last watcher gone: stop polling this ticker
+                    del self._subscribers[ticker]
+                    self._pollers.pop(ticker).cancel()
+                    self._prices.pop(ticker, None)
+
+    async def shutdown(self):
+        async with self._lock:
+            for task in self._pollers.values():
+                task.cancel()
+            self._pollers.clear()
+            self._subscribers.clear()
+            self._prices.clear()
+
+    def stats(self) -> dict:
+        return {
+            "tickers": len(self._pollers),
+            "subscriptions": sum(len(s) for s in self._subscribers.values()),
+            "upstream_calls": self.upstream_calls,
+        }
+
+    async def _poll(self, ticker: str):
+        while True:
+            try:
+                self.upstream_calls += 1
+                # yfinance is blocking; keep it off the event loop
+                price = await asyncio.to_thread(self.fetch_price, ticker)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Price refresh failed for %s: %s", ticker, e)
+            else:
+                self._prices[ticker] = price
+                for subscription in list(self._subscribers.get(ticker, ())):
+                    subscription.offer(ticker, price)
+            await asyncio.sleep(self.refresh_seconds)
+
+
+class PriceCache:
+    """
+    Recent prices by ticker. Lookups of uncached tickers are fetched
+    concurrently; tickers that fail to price are remembered as unknown for
+    the same TTL so bad symbols don't hit the upstream API on every request.
+    """
+    def __init__(self, fetch_price: Callable[[str], float], ttl_seconds: float = 60.0, max_workers: int = 8):
+        self.fetch_price = fetch_price
+        self.ttl_seconds = ttl_seconds
+        self.max_workers = max_workers
+        self._entries: Dict[str, Tuple[float, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.upstream_calls = 0
+
+    def refresh(self, ticker: str) -> float:
+        """Fetch and cache one ticker's price. Raises ValueError if it can't be priced."""
+        ticker = ticker.upper()
+        self.upstream_calls += 1
+        try:
+            price = self.fetch_price(ticker)
+        except ValueError:
+            self._store(ticker, None)
+            raise
+        self._store(ticker, price)
+        return price
+
+    def get_many(self, tickers: Iterable[str]) -> Dict[str, float]:
+        """Prices for the given tickers; tickers that can't be priced are left out."""
+        now = time.monotonic()
+        prices: Dict[str, float] = {}
+        missing = []
+        for ticker in {t.upper() for t in tickers}:
+            entry = self._entries.get(ticker)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                if entry[1] is not None:
+                    prices[ticker] = entry[1]
+            else:
+                missing.append(ticker)
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                for ticker, price in zip(missing, executor.map(self._try_refresh, missing)):
+                    if price is not None:
+                        prices[ticker] = price
+        return prices
+
+    def _try_refresh(self, ticker: str) -> Optional[float]:
+        try:
+            return self.refresh(ticker)
+        except ValueError:
+            return None
+
+    def _store(self, ticker: str, price: Optional[float]):
+        with self._lock:
+            if len(self._entries) > 10000:
+                now = time.monotonic()
+                self._entries = {t: e for t, e in self._entries.items() if e[0] > now}
+            self._entries[ticker] = (time.monotonic() + self.ttl_seconds, price)
+
+    def stats(self) -> dict:
+        return {
+            "cached_tickers": len(self._entries),
+            "hits": self.hits,
+            "upstream_calls": self.upstream_calls,
+        }
@@ -1,17 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import User, Account
 from app.schemas import AccountCreate, AccountResponse, AccountUpdate
 from app.security import get_current_user
+from app.health_score import mark_health_score_stale
 
 router = APIRouter()
 
 @router.get("/", response_model=List[AccountResponse])
 def get_accounts(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     accounts = db.query(Account).filter(Account.user_id == current_user.id).all()
     return [AccountResponse.model_validate(acc) for acc in accounts]
@@ -27,6 +28,7 @@ def create_account(
         **account.dict()
     )
     db.add(db_account)
+    mark_health_score_stale(db, current_user.id)
     db.commit()
     db.refresh(db_account)
     return AccountResponse.model_validate(db_account)
@@ -35,7 +37,7 @@ def create_account(
 def get_account(
     account_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     account = db.query(Account).filter(
         Account.id == account_id,
@@ -64,6 +66,8 @@ def update_account(
         account.balance = account_update.balance
     if account_update.institution_name is not None:
         account.institution_name = account_update.institution_name
+    if account_update.balance is not None:
+        mark_health_score_stale(db, current_user.id)
     
     db.commit()
     db.refresh(account)
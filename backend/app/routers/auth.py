@@ -1,21 +1,24 @@
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import User
-from app.schemas import UserCreate, UserResponse, Token
+from app.database import SHARDING_ENABLED, bind_to_shard, get_db
+from app.models import User, RefreshToken
+from app.schemas import UserCreate, UserResponse, Token, RefreshRequest
 from app.security import (
     get_password_hash,
     authenticate_user,
-    create_access_token,
-    ACCESS_TOKEN_EXPIRE_MINUTES
+    issue_tokens,
+    rotate_refresh_token,
+    revoke_token_family,
+    hash_refresh_token,
+    route_refresh_token
 )
+from app.sharding import allocate_user, release_user, shard_for_username
 
 router = APIRouter()
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+def register(user_data: UserCreate, request: Request, db: Session = Depends(get_db)):
     # OWASP: Input validation (Pydantic handles this, but adding explicit checks)
     if len(user_data.username) < 3 or len(user_data.username) > 50:
         raise HTTPException(
@@ -28,32 +31,50 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
             detail="Password must be at least 8 characters long"
         )
     
-    # Check if user already exists
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
-    if existing_user:
-        # OWASP: Don't reveal if username exists (prevent user enumeration)
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Registration failed"
-        )
+    # OWASP: Don't reveal if username exists (prevent user enumeration)
+    registration_failed = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Registration failed"
+    )
+    user_id = None
+    if SHARDING_ENABLED:
+        # The shard directory owns username uniqueness and user ids across shards
+        allocation = allocate_user(user_data.username)
+        if allocation is None:
+            raise registration_failed
+        user_id, shard = allocation
+        bind_to_shard(db, shard, request)
+    else:
+        # Check if user already exists
+        existing_user = db.query(User).filter(User.username == user_data.username).first()
+        if existing_user:
+            raise registration_failed
     
     # Create new user
     hashed_password = get_password_hash(user_data.password)
     db_user = User(
+        id=user_id,
         username=user_data.username,
         hashed_password=hashed_password,
         currency_preference=user_data.currency_preference
     )
     db.add(db_user)
-    db.commit()
+    try:
+        db.commit()
+    except Exception:
+        if user_id is not None:
+            release_user(user_id)
+        raise
     db.refresh(db_user)
     return db_user
 
 @router.post("/login", response_model=Token)
 def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
+    bind_to_shard(db, shard_for_username(form_data.username), request)
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
@@ -61,9 +82,25 @@ def login(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    tokens, _ = issue_tokens(db, user)
+    db.commit()
+    return tokens
+
+@router.post("/refresh", response_model=Token)
+def refresh(body: RefreshRequest, request: Request, db: Session = Depends(get_db)):
+    route_refresh_token(db, body.refresh_token, request)
+    # No password hashing here: a keyed hash lookup replaces the Argon2 verify
+    _, tokens = rotate_refresh_token(db, body.refresh_token)
+    return tokens
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(body: RefreshRequest, request: Request, db: Session = Depends(get_db)):
+    route_refresh_token(db, body.refresh_token, request)
+    db_token = db.query(RefreshToken).filter(
+        RefreshToken.token_hash == hash_refresh_token(body.refresh_token)
+    ).first()
+    if db_token:
+        revoke_token_family(db, db_token.family_id)
+        db.commit()
+    return None
 
@@ -0,0 +1,114 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func
+from typing import List
+from datetime import datetime, timezone
+from app.database import get_db, get_read_db
+from app.models import User, Account, Transaction, Budget, BudgetCounter, BudgetAlert, TransactionCategory
+from app.schemas import BudgetUpdate, BudgetResponse, BudgetAlertResponse
+from app.security import get_current_user
+from app.budgets import month_start, increment_counter
+
+router = APIRouter()
+
+def _budget_response(budget: Budget, month, spent: float) -> BudgetResponse:
+    return BudgetResponse(
+        category=budget.category,
+        monthly_limit=budget.monthly_limit,
+        alert_threshold=budget.alert_threshold,
+        month=month,
+        spent=spent,
+        remaining=budget.monthly_limit - spent,
+        percentage_used=(spent / budget.monthly_limit * 100) if budget.monthly_limit > 0 else 0.0
+    )
+
+@router.get("/", response_model=List[BudgetResponse])
+def get_budgets(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    # One indexed read: budgets joined to this month's running counters
+    month = month_start(None)
+    rows = db.query(Budget, BudgetCounter.spent).outerjoin(
+        BudgetCounter,
+        and_(
+            BudgetCounter.user_id == Budget.user_id,
+            BudgetCounter.category == Budget.category,
+            BudgetCounter.month == month
+        )
+    ).filter(Budget.user_id == current_user.id).all()
+    return [_budget_response(budget, month, spent or 0.0) for budget, spent in rows]
+
+@router.put("/{category}", response_model=BudgetResponse)
+def set_budget(
+    category: TransactionCategory,
+    budget_update: BudgetUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if budget_update.monthly_limit <= 0:
+        raise HTTPException(status_code=400, detail="monthly_limit must be positive")
+    if not 0 < budget_update.alert_threshold <= 1:
+        raise HTTPException(status_code=400, detail="alert_threshold must be between 0 and 1")
+
+    budget = db.query(Budget).filter(
+        Budget.user_id == current_user.id,
+        Budget.category == category
+    ).first()
+    if budget is None:
+        budget = Budget(user_id=current_user.id, category=category)
+        db.add(budget)
+    budget.monthly_limit = budget_update.monthly_limit
+    budget.alert_threshold = budget_update.alert_threshold
+
+    month = month_start(None)
+    spent = db.query(BudgetCounter.spent).filter(
+        BudgetCounter.user_id == current_user.id,
+        BudgetCounter.category == category,
+        BudgetCounter.month == month
+    ).scalar()
+    if spent is None:
+        # One-time seed from history written before counters existed
+        month_begin = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+        month_end = datetime(month.year + month.month // 12, month.month % 12 + 1, 1, tzinfo=timezone.utc)
+        seed = db.query(func.sum(-Transaction.amount)).join(Account).filter(
+            Account.user_id == current_user.id,
+            Transaction.category == category,
+            Transaction.category != TransactionCategory.SALARY,
+            Transaction.amount < 0,
+            Transaction.timestamp >= month_begin,
+            Transaction.timestamp < month_end
+        ).scalar() or 0.0
+        spent = increment_counter(db, current_user.id, category, month, seed)
+
+    db.commit()
+    db.refresh(budget)
+    return _budget_response(budget, month, spent)
+
+@router.delete("/{category}", status_code=204)
+def delete_budget(
+    category: TransactionCategory,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    budget = db.query(Budget).filter(
+        Budget.user_id == current_user.id,
+        Budget.category == category
+    ).first()
+    if not budget:
+        raise HTTPException(status_code=404, detail="Budget not found")
+
+    db.delete(budget)
+    db.commit()
+    return None
+
+@router.get("/alerts", response_model=List[BudgetAlertResponse])
+def get_budget_alerts(
+    limit: int = 50,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    alerts = db.query(BudgetAlert).filter(
+        BudgetAlert.user_id == current_user.id
+    ).order_by(BudgetAlert.created_at.desc(), BudgetAlert.id.desc()).limit(limit).all()
+    return [BudgetAlertResponse.model_validate(a) for a in alerts]
@@ -2,17 +2,26 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func, extract
 from datetime import datetime, timedelta
-from app.database import get_db
-from app.models import User, Account, Transaction, AccountType, TransactionCategory
-from app.schemas import DashboardSummary
+import numpy as np
+from app.database import get_db, get_read_db
+from app.models import User, Account, Transaction, AccountType, TransactionCategory, HealthScore
+from app.schemas import (
+    DashboardSummary, HealthScoreResponse, HealthScoreComponent,
+    CashFlowForecast, AccountForecast, ForecastPoint, RecurringSeriesResponse
+)
 from app.security import get_current_user
+from app.health_score import WEIGHTS, component_scores, is_fresh, score_users
+from app.singleflight import coalesced
+from app.forecast import FORECAST_DAYS, get_recurring_series, project_balances
+from app.columnar import FORMAT_QUERY, columnar_response
 
 router = APIRouter()
 
 @router.get("/summary", response_model=DashboardSummary)
+@coalesced
 def get_dashboard_summary(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     # Get all accounts for the user
     accounts = db.query(Account).filter(Account.user_id == current_user.id).all()
@@ -79,3 +88,71 @@ def get_dashboard_summary(
         top_spending_categories=top_spending_categories
     )
 
+
+@router.get("/health-score", response_model=HealthScoreResponse)
+@coalesced
+def get_health_score(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    health_score = db.query(HealthScore).filter(HealthScore.user_id == current_user.id).first()
+    if not is_fresh(health_score):
+        # Inputs changed since the last (nightly or on-demand) computation
+        health_score = score_users(db, [current_user.id])[0]
+        db.commit()
+    
+    metrics = {
+        name: np.array([np.nan if getattr(health_score, name) is None else getattr(health_score, name)])
+        for name in WEIGHTS
+    }
+    scores = component_scores(metrics)
+    return HealthScoreResponse(
+        score=health_score.score,
+        components=[
+            HealthScoreComponent(
+                name=name,
+                value=getattr(health_score, name),
+                score=float(scores[name][0]),
+                weight=weight
+            )
+            for name, weight in WEIGHTS.items()
+        ],
+        computed_at=health_score.computed_at
+    )
+
+@router.get("/forecast", response_model=CashFlowForecast)
+@coalesced
+def get_cash_flow_forecast(
+    response_format: str = FORMAT_QUERY,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    series = get_recurring_series(db, current_user.id)
+    accounts = db.query(Account).filter(Account.user_id == current_user.id).order_by(Account.id).all()
+    today = datetime.utcnow().date()
+    balances = project_balances(accounts, series, today, FORECAST_DAYS)
+    days = [today + timedelta(days=i) for i in range(FORECAST_DAYS + 1)]
+    
+    if response_format == "columnar":
+        rows = [
+            (day, account.id, float(balance))
+            for account in accounts
+            for day, balance in zip(days, balances[account.id])
+        ]
+        return columnar_response(rows, ["day", "account_id", "balance"])
+    
+    return CashFlowForecast(
+        horizon_days=FORECAST_DAYS,
+        accounts=[
+            AccountForecast(
+                account_id=account.id,
+                institution_name=account.institution_name,
+                points=[
+                    ForecastPoint(day=day, balance=float(balance))
+                    for day, balance in zip(days, balances[account.id])
+                ]
+            )
+            for account in accounts
+        ],
+        recurring=[RecurringSeriesResponse.model_validate(s) for s in series]
+    )
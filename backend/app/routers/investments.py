@@ -1,11 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List, Optional
+import os
 import yfinance as yf
-from app.database import get_db
-from app.models import User, Portfolio
-from app.schemas import InvestmentPerformance, PortfolioResponse, PortfolioCreate
+from app.database import close_request_sessions, get_db, get_read_db
+from app.models import User, Portfolio, PortfolioLot
+from app.schemas import (
+    InvestmentPerformance,
+    PortfolioResponse,
+    PortfolioCreate,
+    PortfolioLotResponse,
+    HoldingsImportResponse
+)
 from app.security import get_current_user
+from app.price_stream import PriceCache, PriceHub
+from app.holdings import TICKER_PATTERN, add_lots, normalize_ticker, read_trades, validate_trades
+from app.health_score import mark_health_score_stale
+from app.singleflight import coalesced
 
 router = APIRouter()
 
@@ -35,6 +48,11 @@ def get_stock_price(ticker: str) -> float:
         # Return None to indicate failure, let caller handle it
         raise ValueError(f"Could not fetch price for ticker {ticker}: {str(e)}")
 
+# Prices shared by performance requests and import validation
+price_cache = PriceCache(get_stock_price, ttl_seconds=float(os.getenv("PRICE_CACHE_SECONDS", "60")))
+# One shared poller per distinct ticker across all streaming connections; polls also refresh the cache
+price_hub = PriceHub(price_cache.refresh, refresh_seconds=float(os.getenv("PRICE_REFRESH_SECONDS", "15")))
+
 def calculate_sharpe_ratio(returns: List[float], risk_free_rate: float = 0.02) -> float:
     """Calculate Sharpe ratio (simplified version)."""
     if not returns or len(returns) < 2:
@@ -49,13 +67,8 @@ def calculate_sharpe_ratio(returns: List[float], risk_free_rate: float = 0.02) -
     
     return (mean_return - risk_free_rate) / std_dev
 
-@router.get("/performance", response_model=InvestmentPerformance)
-def get_investment_performance(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    portfolios = db.query(Portfolio).filter(Portfolio.user_id == current_user.id).all()
-    
+def calculate_performance(portfolios: List[Portfolio], prices: Dict[str, float]) -> InvestmentPerformance:
+    """Value holdings at the given prices, falling back to cost basis for missing tickers."""
     if not portfolios:
         return InvestmentPerformance(
             total_value=0.0,
@@ -72,14 +85,12 @@ def get_investment_performance(
     asset_allocation = []
     
     for portfolio in portfolios:
-        try:
-            current_price = get_stock_price(portfolio.ticker_symbol)
-            current_value = current_price * portfolio.shares_owned
-        except (ValueError, Exception) as e:
+        current_price = prices.get(portfolio.ticker_symbol.upper())
+        if current_price is None:
             # If we can't get the price, use cost basis as fallback
             # This prevents one bad ticker from breaking the entire performance calculation
-            current_value = portfolio.cost_basis * portfolio.shares_owned
             current_price = portfolio.cost_basis
+        current_value = current_price * portfolio.shares_owned
         cost_basis = portfolio.cost_basis * portfolio.shares_owned
         
         total_value += current_value
@@ -115,10 +126,57 @@ def get_investment_performance(
         asset_allocation=asset_allocation
     )
 
+@router.get("/performance", response_model=InvestmentPerformance)
+@coalesced
+def get_investment_performance(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    # One position row per ticker, priced once each
+    portfolios = db.query(Portfolio).filter(Portfolio.user_id == current_user.id).all()
+    prices = price_cache.get_many(p.ticker_symbol for p in portfolios)
+    return calculate_performance(portfolios, prices)
+
+def _load_positions_for_stream(db: Session, user_id: int) -> List[Portfolio]:
+    portfolios = db.query(Portfolio).filter(Portfolio.user_id == user_id).all()
+    # Don't hold pooled connections for the lifetime of the stream
+    db.expunge_all()
+    close_request_sessions(db)
+    return portfolios
+
+@router.get("/performance/stream")
+async def stream_investment_performance(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Server-Sent Events stream of portfolio performance, pushed whenever a
+    held ticker's price changes. Prices come from the shared price hub.
+    """
+    # Pool checkouts and replica connects block; keep them off the event loop
+    portfolios = await run_in_threadpool(_load_positions_for_stream, db, current_user.id)
+    
+    async def events():
+        subscription = await price_hub.subscribe(p.ticker_symbol for p in portfolios)
+        prices = {t: price_hub.latest(t) for t in subscription.tickers if price_hub.latest(t) is not None}
+        try:
+            yield f"data: {calculate_performance(portfolios, prices).model_dump_json()}\n\n"
+            while subscription.tickers:
+                prices.update(await subscription.next_prices())
+                yield f"data: {calculate_performance(portfolios, prices).model_dump_json()}\n\n"
+        finally:
+            await subscription.close()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/", response_model=List[PortfolioResponse])
 def get_portfolios(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     portfolios = db.query(Portfolio).filter(Portfolio.user_id == current_user.id).all()
     return [PortfolioResponse.model_validate(p) for p in portfolios]
@@ -129,14 +187,74 @@ def create_portfolio(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    db_portfolio = Portfolio(
-        user_id=current_user.id,
-        **portfolio.dict()
-    )
-    db.add(db_portfolio)
+    """Record a purchase. Buying a ticker already held adds to that position."""
+    ticker = normalize_ticker(portfolio.ticker_symbol)
+    # OWASP: Input validation
+    if not TICKER_PATTERN.match(ticker):
+        raise HTTPException(status_code=400, detail="Invalid ticker symbol")
+    if portfolio.shares_owned <= 0:
+        raise HTTPException(status_code=400, detail="Shares must be positive")
+    if portfolio.cost_basis < 0:
+        raise HTTPException(status_code=400, detail="Cost basis cannot be negative")
+    
+    add_lots(db, current_user.id, [(ticker, portfolio.shares_owned, portfolio.cost_basis, None)])
+    mark_health_score_stale(db, current_user.id)
     db.commit()
-    db.refresh(db_portfolio)
-    return PortfolioResponse.model_validate(db_portfolio)
+    position = db.query(Portfolio).filter(
+        Portfolio.user_id == current_user.id,
+        Portfolio.ticker_symbol == ticker
+    ).one()
+    return PortfolioResponse.model_validate(position)
+
+def _save_trades(db: Session, user_id: int, trades) -> List[PortfolioResponse]:
+    tickers = add_lots(db, user_id, trades)
+    mark_health_score_stale(db, user_id)
+    db.commit()
+    positions = db.query(Portfolio).filter(
+        Portfolio.user_id == user_id,
+        Portfolio.ticker_symbol.in_(tickers)
+    ).order_by(Portfolio.ticker_symbol).all()
+    return [PortfolioResponse.model_validate(p) for p in positions]
+
+@router.post("/import", response_model=HoldingsImportResponse, status_code=201)
+async def import_holdings(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Import purchases from a CSV (ticker, shares, price, optional date) or a
+    JSON array of the same fields. All rows are validated, and all tickers
+    priced, before anything is written; any error rejects the whole file.
+    """
+    contents = await file.read()
+    try:
+        df = read_trades(contents, file.filename)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Could not parse trades file")
+    
+    # Pricing uncached tickers is network-bound; keep it off the event loop
+    trades, errors = await run_in_threadpool(validate_trades, df, price_cache.get_many)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+    if not trades:
+        raise HTTPException(status_code=400, detail="No trades in file")
+    
+    # Database work blocks (including a pool checkout after the commit); keep it off the event loop
+    positions = await run_in_threadpool(_save_trades, db, current_user.id, trades)
+    return HoldingsImportResponse(lots_imported=len(trades), positions=positions)
+
+@router.get("/lots", response_model=List[PortfolioLotResponse])
+def get_lots(
+    ticker: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    query = db.query(PortfolioLot).filter(PortfolioLot.user_id == current_user.id)
+    if ticker:
+        query = query.filter(PortfolioLot.ticker_symbol == normalize_ticker(ticker))
+    lots = query.order_by(PortfolioLot.purchased_at, PortfolioLot.id).all()
+    return [PortfolioLotResponse.model_validate(lot) for lot in lots]
 
 @router.delete("/{portfolio_id}", status_code=204)
 def delete_portfolio(
@@ -151,7 +269,12 @@ def delete_portfolio(
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
     
+    db.query(PortfolioLot).filter(
+        PortfolioLot.user_id == current_user.id,
+        PortfolioLot.ticker_symbol == portfolio.ticker_symbol
+    ).delete(synchronize_session=False)
     db.delete(portfolio)
+    mark_health_score_stale(db, current_user.id)
     db.commit()
     return None
 
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from typing import List
 import pandas as pd
 import io
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import User, Account, Transaction, TransactionCategory
 from app.schemas import TransactionCreate, TransactionResponse
 from app.security import get_current_user
+from app.partitioning import ensure_partitions_for, read_archived_transactions, shard_archive_dir
+from app.budgets import record_spending
+from app.health_score import mark_health_score_stale
+from app.columnar import FORMAT_QUERY, columnar_response
+from app.forecast import mark_recurring_stale, note_transaction
 
 router = APIRouter()
 
@@ -65,7 +71,12 @@ async def upload_transactions(
         )
         db.add(transaction)
         transactions.append(transaction)
+    ensure_partitions_for(db.connection(), [t.timestamp for t in transactions])
     
+    # One counter upsert per (category, month) for the whole file
+    record_spending(db, current_user.id, [(t.category, t.timestamp, t.amount) for t in transactions])
+    mark_health_score_stale(db, current_user.id)
+    mark_recurring_stale(db, current_user.id)
     db.commit()
     
     return [TransactionResponse.model_validate(t) for t in transactions]
@@ -74,15 +85,69 @@ async def upload_transactions(
 def get_transactions(
     skip: int = 0,
     limit: int = 100,
+    response_format: str = FORMAT_QUERY,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
+    if response_format == "columnar":
+        # Plain column tuples: no ORM objects or response models per row
+        rows = db.query(
+            Transaction.id,
+            Transaction.account_id,
+            Transaction.timestamp,
+            Transaction.amount,
+            Transaction.category,
+            Transaction.description
+        ).join(Account).filter(
+            Account.user_id == current_user.id
+        ).order_by(Transaction.timestamp.desc()).offset(skip).limit(limit).all()
+        return columnar_response(
+            rows,
+            ["id", "account_id", "timestamp", "amount", "category", "description"],
+            dictionary=["category"]
+        )
+    
     transactions = db.query(Transaction).join(Account).filter(
         Account.user_id == current_user.id
     ).order_by(Transaction.timestamp.desc()).offset(skip).limit(limit).all()
     
     return [TransactionResponse.model_validate(t) for t in transactions]
 
+@router.get("/export")
+def export_transactions(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """CSV of all transactions, including months archived out of the database."""
+    account_ids = [
+        account_id for (account_id,) in
+        db.query(Account.id).filter(Account.user_id == current_user.id).all()
+    ]
+    rows = db.query(
+        Transaction.account_id,
+        Transaction.amount,
+        Transaction.category,
+        Transaction.description,
+        Transaction.timestamp
+    ).filter(Transaction.account_id.in_(account_ids)).all()
+    
+    live = pd.DataFrame(
+        [(a, amt, cat.value, desc, ts) for a, amt, cat, desc, ts in rows],
+        columns=["account_id", "amount", "category", "description", "timestamp"]
+    )
+    shard = getattr(request.state, "shard", None)
+    archived = read_archived_transactions(account_ids, shard_archive_dir(shard.id if shard else 0))
+    df = pd.concat([archived, live], ignore_index=True) if not archived.empty else live
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    df = df.sort_values("timestamp", kind="stable")
+    
+    return Response(
+        content=df[["amount", "category", "description", "timestamp"]].to_csv(index=False),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=transactions.csv"}
+    )
+
 @router.post("/", response_model=TransactionResponse, status_code=201)
 def create_transaction(
     transaction: TransactionCreate,
@@ -97,11 +162,18 @@ def create_transaction(
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     
+    ensure_partitions_for(db.connection(), [transaction.timestamp])
     db_transaction = Transaction(**transaction.dict())
     db.add(db_transaction)
     
     # Update account balance
     account.balance += transaction.amount
+    record_spending(db, current_user.id, [(transaction.category, transaction.timestamp, transaction.amount)])
+    mark_health_score_stale(db, current_user.id)
+    note_transaction(
+        db, current_user.id, transaction.account_id,
+        transaction.amount, transaction.description, transaction.timestamp
+    )
     db.commit()
     db.refresh(db_transaction)
     
@@ -127,6 +199,13 @@ def delete_transaction(
     
     # Reverse the transaction amount from account balance
     account.balance -= transaction.amount
+    record_spending(
+        db, current_user.id,
+        [(transaction.category, transaction.timestamp, transaction.amount)],
+        reverse=True
+    )
+    mark_health_score_stale(db, current_user.id)
+    mark_recurring_stale(db, current_user.id)
     
     # Delete the transaction
     db.delete(transaction)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from app.models import AccountType, TransactionCategory
 
 # Auth Schemas
@@ -19,6 +19,10 @@ class UserResponse(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -77,6 +81,44 @@ class PortfolioResponse(BaseModel):
     cost_basis: float
     created_at: datetime
 
+class PortfolioLotResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    ticker_symbol: str
+    shares: float
+    price: float
+    purchased_at: Optional[datetime]
+
+class HoldingsImportResponse(BaseModel):
+    lots_imported: int
+    positions: List[PortfolioResponse]
+
+# Budget Schemas
+class BudgetUpdate(BaseModel):
+    monthly_limit: float
+    alert_threshold: float = 0.8
+
+class BudgetResponse(BaseModel):
+    category: TransactionCategory
+    monthly_limit: float
+    alert_threshold: float
+    month: date
+    spent: float
+    remaining: float
+    percentage_used: float
+
+class BudgetAlertResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    category: TransactionCategory
+    month: date
+    threshold: float
+    spent: float
+    monthly_limit: float
+    created_at: datetime
+
 # Dashboard Schemas
 class DashboardSummary(BaseModel):
     net_worth: float
@@ -96,3 +138,38 @@ class InvestmentPerformance(BaseModel):
     sharpe_ratio: Optional[float] = None
     asset_allocation: List[dict]
 
+
+class HealthScoreComponent(BaseModel):
+    name: str
+    value: Optional[float]
+    score: float
+    weight: float
+
+class HealthScoreResponse(BaseModel):
+    score: float
+    components: List[HealthScoreComponent]
+    computed_at: datetime
+
+class RecurringSeriesResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    account_id: int
+    description: Optional[str]
+    category: TransactionCategory
+    amount: float
+    period_days: float
+    next_expected: datetime
+
+class ForecastPoint(BaseModel):
+    day: date
+    balance: float
+
+class AccountForecast(BaseModel):
+    account_id: int
+    institution_name: str
+    points: List[ForecastPoint]
+
+class CashFlowForecast(BaseModel):
+    horizon_days: int
+    accounts: List[AccountForecast]
+    recurring: List[RecurringSeriesResponse]
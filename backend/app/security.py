@@ -1,13 +1,20 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import User
+from app.database import bind_to_shard, get_db
+from app.models import User, RefreshToken
+from app.sharding import shard_for_user_id, shard_for_username
+import hashlib
+import hmac
 import os
+import secrets
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -28,6 +35,9 @@ if len(SECRET_KEY) < 32:
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+# Seconds a just-rotated refresh token is still accepted, for tabs refreshing at the same time
+REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "30"))
 
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
@@ -50,6 +60,138 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+class RevocationSet:
+    """
+    Bounded in-memory set of revoked token families. Entries only need to live
+    as long as an access token can, after which the JWT expiry rejects it anyway.
+    """
+    def __init__(self, ttl_seconds: float, max_entries: int = 100_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, family_id: str):
+        with self._lock:
+            self._entries.pop(family_id, None)
+            self._entries[family_id] = time.monotonic() + self.ttl_seconds
+            self._evict()
+
+    def __contains__(self, family_id: object) -> bool:
+        expires = self._entries.get(family_id)
+        return expires is not None and expires > time.monotonic()
+
+    def _evict(self):
+        # Oldest first: insertion order matches expiry order
+        now = time.monotonic()
+        while self._entries:
+            family_id, expires = next(iter(self._entries.items()))
+            if expires > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+# Per-process; other workers stop honoring a revoked family's access tokens at their expiry
+revoked_families = RevocationSet(ttl_seconds=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+def hash_refresh_token(token: str) -> str:
+    # OWASP: Store refresh tokens hashed; keyed so a DB leak alone can't forge lookups
+    return hmac.new(SECRET_KEY.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+def issue_tokens(db: Session, user: User, family_id: Optional[str] = None) -> Tuple[dict, RefreshToken]:
+    """
+    Mint an access token and a new refresh token in the given family (a new
+    family per login). The refresh token row is flushed, not committed.
+    """
+    family_id = family_id or secrets.token_urlsafe(16)
+    # The user id prefix lets /refresh and /logout find the user's shard
+    refresh_token = f"{user.id}.{secrets.token_urlsafe(32)}"
+    db_token = RefreshToken(
+        user_id=user.id,
+        token_hash=hash_refresh_token(refresh_token),
+        family_id=family_id,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    db.add(db_token)
+    db.flush()
+    tokens = {**_access_tokens(user, family_id), "refresh_token": refresh_token}
+    return tokens, db_token
+
+def _access_tokens(user: User, family_id: str) -> dict:
+    access_token = create_access_token(
+        data={"sub": user.username, "fam": family_id},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
+
+def revoke_token_family(db: Session, family_id: str):
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: datetime.now(timezone.utc)}, synchronize_session=False)
+    revoked_families.add(family_id)
+
+def route_refresh_token(db: Session, refresh_token: str, request: Optional[Request] = None):
+    """Bind the session to the shard of the refresh token's user."""
+    user_id, _, _ = refresh_token.partition(".")
+    if user_id.isdigit():
+        bind_to_shard(db, shard_for_user_id(int(user_id)), request)
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite returns naive datetimes
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+def _in_reuse_grace(db: Session, db_token: RefreshToken) -> bool:
+    """
+    A token rotated moments ago whose family is still live, e.g. two tabs
+    sharing one stored token that both refresh on wake-up.
+    """
+    if db_token.replaced_by_id is None:
+        # Revoked by logout or theft detection, not by rotation
+        return False
+    rotated_for = datetime.now(timezone.utc) - _as_utc(db_token.revoked_at)
+    if rotated_for > timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+        return False
+    return db.query(RefreshToken.id).filter(
+        RefreshToken.family_id == db_token.family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).first() is not None
+
+def rotate_refresh_token(db: Session, refresh_token: str) -> Tuple[User, dict]:
+    """
+    Exchange a refresh token for a new token pair. Presenting a token that was
+    already rotated or revoked is treated as theft and revokes its whole family,
+    unless it was rotated within the last REFRESH_REUSE_GRACE_SECONDS: then only
+    an access token is returned, and the family keeps its single refresh token.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    db_token = db.query(RefreshToken).filter(
+        RefreshToken.token_hash == hash_refresh_token(refresh_token)
+    ).with_for_update().first()
+    if db_token is None:
+        raise invalid
+    reused = db_token.revoked_at is not None
+    if reused and not _in_reuse_grace(db, db_token):
+        # OWASP: Refresh token reuse detection
+        revoke_token_family(db, db_token.family_id)
+        db.commit()
+        raise invalid
+    if _as_utc(db_token.expires_at) <= datetime.now(timezone.utc):
+        raise invalid
+    if reused:
+        # Another tab won the rotation and already stored the successor; don't fork the family
+        db.commit()
+        return db_token.user, _access_tokens(db_token.user, db_token.family_id)
+    
+    tokens, new_token = issue_tokens(db, db_token.user, family_id=db_token.family_id)
+    db_token.revoked_at = datetime.now(timezone.utc)
+    db_token.replaced_by_id = new_token.id
+    db.commit()
+    return db_token.user, tokens
+
 def authenticate_user(db: Session, username: str, password: str):
     user = db.query(User).filter(User.username == username).first()
     if not user:
@@ -58,7 +200,8 @@ def authenticate_user(db: Session, username: str, password: str):
         return False
     return user
 
-async def get_current_user(
+def get_current_user(
+    request: Request,
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ):
@@ -72,8 +215,12 @@ async def get_current_user(
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
+        if payload.get("fam") in revoked_families:
+            raise credentials_exception
     except JWTError:
         raise credentials_exception
+    # Every session of this request now goes to the user's shard
+    bind_to_shard(db, shard_for_username(username), request)
     user = db.query(User).filter(User.username == username).first()
     if user is None:
         raise credentials_exception
@@ -0,0 +1,286 @@
+"""
+User shard directory and shard-move tool.
+
+With DATABASE_SHARD_URLS set, each user's rows live on one shard. The
+directory table on the main database maps usernames to a globally unique user
+id and a shard; registration allocates both. Lookups are cached briefly per
+process. Moving a user to another shard is done online:
+
+    python -m app.sharding move --user-id 42 --to 2
+    python -m app.sharding backfill-directory   # once, when enabling sharding on an existing database
+
+During a move the user gets 503 responses for a few seconds. Rows other than
+the user row get new ids on the target shard. Users with archived
+transactions can't be moved: the Parquet archives are per shard and keyed by
+the old account ids.
+"""
+import argparse
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import Boolean, Column, Integer, String, insert, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, SHARDING_ENABLED, Shard, engine, shards
+from app.models import Account, User
+from app.partitioning import ensure_partitions_for, read_archived_transactions, shard_archive_dir
+
+# Seconds a directory lookup is reused by a process; moves wait this out
+SHARD_DIRECTORY_CACHE_SECONDS = 5.0
+
+DirectoryBase = declarative_base()
+
+class UserShard(DirectoryBase):
+    __tablename__ = "user_shards"
+
+    user_id = Column(Integer, primary_key=True)  # Allocates user ids across all shards
+    username = Column(String, unique=True, index=True, nullable=False)
+    shard_id = Column(Integer, nullable=False)
+    moving = Column(Boolean, nullable=False, default=False)
+
+DirectorySession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class Placement(NamedTuple):
+    user_id: int
+    shard_id: int
+    moving: bool
+
+_cache: Dict[Tuple[str, object], Tuple[float, Optional[Placement]]] = {}
+_cache_lock = threading.Lock()
+
+def _lookup(field: str, value) -> Optional[Placement]:
+    now = time.monotonic()
+    cached = _cache.get((field, value))
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    directory = DirectorySession()
+    try:
+        row = directory.query(UserShard).filter(getattr(UserShard, field) == value).first()
+        placement = Placement(row.user_id, row.shard_id, row.moving) if row else None
+    finally:
+        directory.close()
+    if placement is not None:
+        # Misses aren't cached so a user is routable as soon as registration commits
+        with _cache_lock:
+            if len(_cache) > 100_000:
+                _cache.clear()
+            _cache[(field, value)] = (now + SHARD_DIRECTORY_CACHE_SECONDS, placement)
+    return placement
+
+def _shard_for(placement: Optional[Placement]) -> Shard:
+    if placement is None:
+        # Unknown users, including any created before sharding was enabled, are on shard 0
+        return shards[0]
+    if placement.moving:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Account is being migrated. Please retry shortly.",
+            headers={"Retry-After": str(int(SHARD_DIRECTORY_CACHE_SECONDS) * 2)},
+        )
+    return shards[placement.shard_id]
+
+def shard_for_username(username: str) -> Shard:
+    """The user's shard. Raises 503 while the user is being moved."""
+    if not SHARDING_ENABLED:
+        return shards[0]
+    return _shard_for(_lookup("username", username))
+
+def shard_for_user_id(user_id: int) -> Shard:
+    if not SHARDING_ENABLED:
+        return shards[0]
+    return _shard_for(_lookup("user_id", user_id))
+
+def choose_shard(user_id: int) -> Shard:
+    # The directory records placement, so adding shards never moves existing users
+    return shards[user_id % len(shards)]
+
+def allocate_user(username: str) -> Optional[Tuple[int, Shard]]:
+    """Reserve a user id and shard for a new username; None if the username is taken."""
+    directory = DirectorySession()
+    try:
+        entry = UserShard(username=username, shard_id=0)
+        directory.add(entry)
+        directory.flush()
+        shard = choose_shard(entry.user_id)
+        entry.shard_id = shard.id
+        directory.commit()
+        return entry.user_id, shard
+    except IntegrityError:
+        directory.rollback()
+        return None
+    finally:
+        directory.close()
+
+def release_user(user_id: int):
+    """Undo allocate_user when creating the user on its shard failed."""
+    directory = DirectorySession()
+    try:
+        directory.query(UserShard).filter(UserShard.user_id == user_id).delete()
+        directory.commit()
+    finally:
+        directory.close()
+
+def _user_rows(conn, user_id: int) -> List[Tuple[object, List[dict]]]:
+    """Every row owned by a user, parents before children."""
+    collected = {}
+    result = []
+    for table in Base.metadata.sorted_tables:
+        if table.name == "users":
+            condition = table.c.id == user_id
+        elif "user_id" in table.c:
+            condition = table.c.user_id == user_id
+        else:
+            # Owned through a foreign key to an owned table (e.g. transactions -> accounts)
+            condition = None
+            for fk in table.foreign_keys:
+                parent = fk.column.table
+                if parent is not table and parent.name in collected:
+                    ids = [row[fk.column.name] for row in collected[parent.name]]
+                    condition = fk.parent.in_(ids)
+                    break
+            if condition is None:
+                continue
+        rows = [dict(row) for row in conn.execute(select(table).where(condition)).mappings()]
+        collected[table.name] = rows
+        result.append((table, rows))
+    return result
+
+def _copy_rows(conn, table_rows) -> None:
+    """Insert rows on the target shard, giving them fresh ids and remapping foreign keys."""
+    id_maps: Dict[str, Dict[int, int]] = {}
+    for table, rows in table_rows:
+        if not rows:
+            continue
+        keeps_ids = table.name == "users" or "id" not in table.c
+        self_refs = [fk.parent.name for fk in table.foreign_keys if fk.column.table is table]
+        prepared = []
+        for row in rows:
+            row = dict(row)
+            for fk in table.foreign_keys:
+                mapping = id_maps.get(fk.column.table.name)
+                if fk.column.table is table:
+                    row[fk.parent.name] = None  # Filled in once the whole table is copied
+                elif mapping is not None and row.get(fk.parent.name) is not None:
+                    row[fk.parent.name] = mapping[row[fk.parent.name]]
+            if not keeps_ids:
+                row.pop("id")
+            prepared.append(row)
+        if table.name == "transactions":
+            ensure_partitions_for(conn, [row["timestamp"] for row in rows])
+        if keeps_ids:
+            conn.execute(insert(table), prepared)
+            continue
+        new_ids = conn.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), prepared
+        ).scalars().all()
+        mapping = dict(zip((row["id"] for row in rows), new_ids))
+        id_maps[table.name] = mapping
+        for column in self_refs:
+            for row in rows:
+                if row[column] is not None:
+                    conn.execute(
+                        table.update().where(table.c.id == mapping[row["id"]])
+                        .values({column: mapping[row[column]]})
+                    )
+
+def move_user(user_id: int, target_id: int, drain_seconds: float = SHARD_DIRECTORY_CACHE_SECONDS + 5):
+    """
+    Move a user's rows to another shard while the service stays up:
+    block the user, wait out cached placements and in-flight requests,
+    copy, flip the directory, unblock, then delete from the old shard.
+    Raises RuntimeError if the user has archived transactions.
+    """
+    directory = DirectorySession()
+    try:
+        entry = directory.query(UserShard).filter(UserShard.user_id == user_id).with_for_update().one()
+        source, target = shards[entry.shard_id], shards[target_id]
+        if source is target:
+            return
+        with source.engine.connect() as source_conn:
+            account_ids = source_conn.execute(
+                select(Account.__table__.c.id).where(Account.__table__.c.user_id == user_id)
+            ).scalars().all()
+        if not read_archived_transactions(account_ids, shard_archive_dir(source.id)).empty:
+            # Export would silently lose these months once the accounts get new ids
+            raise RuntimeError(f"user {user_id} has archived transactions on shard {source.id}")
+        entry.moving = True
+        directory.commit()
+        time.sleep(drain_seconds)
+
+        try:
+            with source.engine.connect() as source_conn:
+                table_rows = _user_rows(source_conn, user_id)
+            with target.engine.begin() as target_conn:
+                _copy_rows(target_conn, table_rows)
+        except Exception:
+            entry = directory.query(UserShard).filter(UserShard.user_id == user_id).one()
+            entry.moving = False
+            directory.commit()
+            raise
+
+        entry = directory.query(UserShard).filter(UserShard.user_id == user_id).one()
+        entry.shard_id = target.id
+        entry.moving = False
+        directory.commit()
+    finally:
+        directory.close()
+
+    with source.engine.begin() as source_conn:
+        for table, rows in reversed(table_rows):
+            if not rows:
+                continue
+            key = table.c.id if "id" in table.c else table.c.user_id
+            ids = [row[key.name] for row in rows]
+            if "id" in table.c and any(fk.column.table is table for fk in table.foreign_keys):
+                # Break self-references before deleting
+                for fk in table.foreign_keys:
+                    if fk.column.table is table:
+                        source_conn.execute(table.update().where(key.in_(ids)).values({fk.parent.name: None}))
+            source_conn.execute(table.delete().where(key.in_(ids)))
+
+def backfill_directory():
+    """Register every user already on shard 0, then move the id allocator past them."""
+    directory = DirectorySession()
+    try:
+        known = {user_id for (user_id,) in directory.query(UserShard.user_id).all()}
+        with shards[0].engine.connect() as conn:
+            users = conn.execute(select(User.__table__.c.id, User.__table__.c.username)).all()
+        directory.add_all([
+            UserShard(user_id=user_id, username=username, shard_id=0)
+            for user_id, username in users if user_id not in known
+        ])
+        directory.commit()
+        if engine.dialect.name == "postgresql":
+            directory.execute(text(
+                "SELECT setval(pg_get_serial_sequence('user_shards', 'user_id'), "
+                "(SELECT coalesce(max(user_id), 1) FROM user_shards))"
+            ))
+            directory.commit()
+        return len(users) - len(known)
+    finally:
+        directory.close()
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Manage user shards")
+    commands = parser.add_subparsers(dest="command", required=True)
+    move = commands.add_parser("move", help="move a user to another shard")
+    move.add_argument("--user-id", type=int, required=True)
+    move.add_argument("--to", type=int, required=True, help="target shard id")
+    commands.add_parser("backfill-directory", help="register existing shard-0 users in the directory")
+    args = parser.parse_args(argv)
+
+    if args.command == "move":
+        if not 0 <= args.to < len(shards):
+            parser.error(f"--to must be between 0 and {len(shards) - 1}")
+        try:
+            move_user(args.user_id, args.to)
+        except RuntimeError as e:
+            parser.exit(1, f"not moved: {e}\n")
+        print(f"moved user {args.user_id} to shard {args.to}")
+    else:
+        print(f"registered {backfill_directory()} users")
+
+if __name__ == "__main__":
+    main()
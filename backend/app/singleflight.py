@@ -0,0 +1,151 @@
+"""
+Request coalescing ("single flight") for expensive per-user endpoints.
+
+Concurrent identical requests - same user, route and parameters - await one
+in-flight computation and share its result or its exception. The computation
+runs on its own database sessions, since it can outlive the request that
+started it (e.g. when that request times out).
+"""
+import asyncio
+import functools
+import inspect
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+from fastapi import BackgroundTasks, HTTPException, Request, Response, params, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.database import close_request_sessions, session_like
+
+SINGLE_FLIGHT_TIMEOUT_SECONDS = float(os.getenv("SINGLE_FLIGHT_TIMEOUT_SECONDS", "30"))
+
+class SingleFlight:
+    def __init__(self, timeout: float = SINGLE_FLIGHT_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.computations = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return fn()'s result, sharing one call among concurrent callers with the same key."""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            # Mark the exception retrieved even if every waiter timed out
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._calls[key] = future
+            self.computations += 1
+            asyncio.ensure_future(self._run(key, fn, future))
+        else:
+            self.coalesced += 1
+        try:
+            # shield: one caller timing out must not cancel the shared computation
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Request timed out"
+            )
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.errors += 1
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            self._calls.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "computations": self.computations,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+        }
+
+single_flight = SingleFlight()
+
+def _with_own_sessions(kwargs: dict):
+    """
+    Release the request's sessions and return (open, close) for replacements
+    the shared computation opens and closes itself.
+    """
+    requested = {name: value for name, value in kwargs.items() if isinstance(value, Session)}
+    for db in {id(db): db for db in requested.values()}.values():
+        # Loaded attributes (e.g. current_user.id) stay readable after close
+        close_request_sessions(db)
+
+    def open_sessions() -> dict:
+        own = {}
+        for db in requested.values():
+            own.setdefault(id(db), session_like(db))
+        return {name: own[id(db)] for name, db in requested.items()}
+
+    def close_sessions(sessions: dict):
+        for db in {id(db): db for db in sessions.values()}.values():
+            db.close()
+
+    return open_sessions, close_sessions
+
+def _key_params(fn: Callable) -> List[str]:
+    """
+    Names of fn's parameters that go into the coalescing key. Raises TypeError
+    for routes that can't be keyed safely, so a mistake fails at import rather
+    than sharing one user's result with another.
+    """
+    parameters = inspect.signature(fn).parameters
+    if "current_user" not in parameters:
+        raise TypeError(f"@coalesced route {fn.__qualname__} needs a current_user parameter")
+    keyed = []
+    for name, parameter in parameters.items():
+        annotation = parameter.annotation
+        if name == "current_user" or (isinstance(annotation, type) and issubclass(annotation, Session)):
+            continue
+        if isinstance(parameter.default, params.Depends) or (
+            isinstance(annotation, type) and issubclass(annotation, (Request, Response, BackgroundTasks))
+        ):
+            raise TypeError(f"@coalesced can't key parameter {name!r} of {fn.__qualname__}")
+        keyed.append(name)
+    return keyed
+
+def coalesced(fn: Callable) -> Callable:
+    """
+    Route decorator (place below @router.get). The key is the authenticated
+    user's id, the route function and the JSON encoding of its other
+    parameters; sync routes run in the threadpool as FastAPI would run them.
+    """
+    route = f"{fn.__module__}.{fn.__qualname__}"
+    keyed = _key_params(fn)
+
+    @functools.wraps(fn)
+    async def wrapper(**kwargs):
+        values = json.dumps(jsonable_encoder({name: kwargs.get(name) for name in keyed}), sort_keys=True)
+        key = (kwargs["current_user"].id, route, values)
+        open_sessions, close_sessions = _with_own_sessions(kwargs)
+
+        if asyncio.iscoroutinefunction(fn):
+            async def compute():
+                sessions = open_sessions()
+                try:
+                    return await fn(**{**kwargs, **sessions})
+                finally:
+                    close_sessions(sessions)
+            return await single_flight.do(key, compute)
+
+        def compute_sync():
+            sessions = open_sessions()
+            try:
+                return fn(**{**kwargs, **sessions})
+            finally:
+                close_sessions(sessions)
+        return await single_flight.do(key, lambda: run_in_threadpool(compute_sync))
+
+    return wrapper
@@ -0,0 +1,69 @@
+"""
+Worker warm-up, run by the lifespan hook before a worker accepts requests.
+
+Opens each pool's connections up front and compiles the heavier queries, so
+the first requests after a rolling deploy don't pay for TCP/TLS/auth
+handshakes and SQL compilation.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import logging
+import os
+import time
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app.database import shard_session, shards
+from app.forecast import _load_history
+from app.health_score import compute_metrics
+from app.security import pwd_context
+
+logger = logging.getLogger(__name__)
+
+# Connections opened per pool at start-up; 0 fills the whole pool
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "0"))
+
+def _open(engine):
+    conn = engine.connect()
+    conn.execute(text("SELECT 1"))
+    return conn
+
+def warm_pool(engine, connections: int = WARMUP_CONNECTIONS) -> int:
+    """Open up to `connections` pooled connections concurrently and return them to the pool."""
+    size = getattr(engine.pool, "size", None)
+    pool_size = size() if callable(size) else 1
+    connections = min(connections, pool_size) if connections else pool_size
+    if connections < 1:
+        return 0
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        opened = list(executor.map(lambda _: _open(engine), range(connections)))
+    for conn in opened:
+        conn.close()
+    return len(opened)
+
+def warm_caches():
+    """Compile the aggregate queries on every shard and load the password-hash backend."""
+    now = datetime.now(timezone.utc)
+    for shard in shards:
+        db = shard_session(shard)
+        try:
+            # No user has id 0: queries compile and run but return nothing
+            compute_metrics(db, [0])
+            _load_history(db, [0], now)
+        finally:
+            db.close()
+    pwd_context.dummy_verify()
+
+def warm_up():
+    started = time.monotonic()
+    opened = 0
+    for shard in shards:
+        # A primary that can't be reached should fail start-up
+        opened += warm_pool(shard.engine)
+        for replica in shard.replicas.engines:
+            try:
+                opened += warm_pool(replica)
+            except OperationalError:
+                # get_read_db falls back to the primary while a replica is down
+                logger.warning("Replica %s unreachable during warm-up", replica.url.render_as_string())
+    warm_caches()
+    logger.info("Warm-up opened %d connections in %.2fs", opened, time.monotonic() - started)
@@ -1,5 +1,55 @@
+import argparse
+import os
 import uvicorn
 
-if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+def main():
+    parser = argparse.ArgumentParser(description="Run the FinPulse API")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        default=os.getenv("ENVIRONMENT") == "production",
+        help="multiple workers, no reload (default when ENVIRONMENT=production)"
+    )
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    args = parser.parse_args()
+
+    if not args.production:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, reload=True)
+        return
+
+    budget = int(os.getenv("DATABASE_MAX_CONNECTIONS", "0"))
+    if budget and args.workers > budget:
+        # Every worker needs at least one connection per database
+        parser.error(f"--workers {args.workers} exceeds DATABASE_MAX_CONNECTIONS={budget}")
+    # Workers inherit this, so each sizes its connection pool to its share of DATABASE_MAX_CONNECTIONS
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    # Create tables once here; workers skip init_db rather than racing on the same DDL
+    from app.main import init_db
+    from app.database import shards
+    init_db()
+    for shard in shards:
+        shard.engine.dispose()
+    os.environ["FINPULSE_DB_INITIALIZED"] = "1"
 
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop",
+        http="httptools",
+        # Outlive the load balancer's idle timeout (commonly 60s) so it, not us, closes idle connections
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_SECONDS", "75")),
+        # On SIGTERM: stop accepting, let in-flight requests finish for up to this long, then exit
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30")),
+        backlog=int(os.getenv("LISTEN_BACKLOG", "2048")),
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        server_header=False,  # OWASP: Don't advertise the server implementation
+        access_log=os.getenv("ACCESS_LOG", "1").lower() in ("1", "true", "yes"),
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Tests run against throwaway SQLite files. Configuration is read when app
+modules are imported, so the environment is set here first.
+"""
+import os
+import tempfile
+
+DB_DIR = tempfile.mkdtemp(prefix="finpulse-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_DIR}/primary.db"
+os.environ["DATABASE_REPLICA_URLS"] = ""
+os.environ["DATABASE_SHARD_URLS"] = f"sqlite:///{DB_DIR}/shard1.db"
+os.environ["TRANSACTIONS_ARCHIVE_DIR"] = f"{DB_DIR}/archive"
+os.environ["SECRET_KEY"] = "test-secret-key-that-is-at-least-32-characters"
+
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from app.database import Base, engine, shards
+import app.models  # noqa: F401  (registers tables)
+from app.sharding import DirectoryBase, backfill_directory
+
+for shard in shards:
+    Base.metadata.create_all(bind=shard.engine)
+DirectoryBase.metadata.create_all(bind=engine)
+
+def make_request(token: str = "client-a") -> Request:
+    """A request already routed to shard 0, as get_current_user would leave it."""
+    request = Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    })
+    request.state.shard = shards[0]
+    return request
+
+@pytest.fixture
+def sqlite_url():
+    def url(name: str) -> str:
+        return f"sqlite:///{DB_DIR}/{name}.db"
+    return url
+
+PASSWORD = "correct-horse-battery"
+
+@pytest.fixture(scope="module")
+def client():
+    from app.main import app
+    # Users other tests created straight on shard 0 predate the directory
+    backfill_directory()
+    with TestClient(app) as client:
+        yield client
+
+def register(client) -> dict:
+    """Register and log in a new user; returns its id and auth headers."""
+    username = f"user-{uuid.uuid4().hex[:10]}"
+    response = client.post("/api/auth/register", json={"username": username, "password": PASSWORD})
+    assert response.status_code == 201
+    tokens = client.post("/api/auth/login", data={"username": username, "password": PASSWORD}).json()
+    return {
+        "id": response.json()["id"],
+        "headers": {"Authorization": f"Bearer {tokens['access_token']}"},
+    }
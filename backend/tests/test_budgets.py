@@ -0,0 +1,145 @@
+from datetime import date, datetime, timedelta, timezone
+import pytest
+from app import budgets
+from app.budgets import increment_counter, month_start, record_spending
+from app.database import shard_session
+from app.models import Budget, BudgetAlert, BudgetCounter, Transaction, TransactionCategory
+from app.sharding import shard_for_user_id
+from tests.conftest import register
+
+FOOD = TransactionCategory.FOOD
+
+@pytest.fixture
+def user(client):
+    user = register(client)
+    account = client.post(
+        "/api/accounts/",
+        json={"type": "checking", "institution_name": "Bank", "balance": 1000},
+        headers=user["headers"]
+    ).json()
+    return {**user, "account_id": account["id"]}
+
+@pytest.fixture
+def db(user):
+    session = shard_session(shard_for_user_id(user["id"]))
+    yield session
+    session.close()
+
+def spend(client, user, amount, category="food"):
+    response = client.post(
+        "/api/transactions/",
+        json={"account_id": user["account_id"], "amount": amount, "category": category},
+        headers=user["headers"]
+    )
+    assert response.status_code == 201
+    return response.json()
+
+def set_budget(client, user, limit, threshold=0.8, category="food"):
+    response = client.put(
+        f"/api/budgets/{category}",
+        json={"monthly_limit": limit, "alert_threshold": threshold},
+        headers=user["headers"]
+    )
+    assert response.status_code == 200
+    return response.json()
+
+def spent(client, user, category="food"):
+    rows = client.get("/api/budgets/", headers=user["headers"]).json()
+    return next(r["spent"] for r in rows if r["category"] == category)
+
+def alerts(client, user):
+    rows = client.get("/api/budgets/alerts", headers=user["headers"]).json()
+    return sorted(r["threshold"] for r in rows)
+
+def test_increment_counter_upserts_one_row_per_month(user, db):
+    month = date(2024, 3, 1)
+    assert increment_counter(db, user["id"], FOOD, month, 5.0) == 5.0
+    assert increment_counter(db, user["id"], FOOD, month, 7.5) == 12.5
+    assert increment_counter(db, user["id"], FOOD, date(2024, 4, 1), 1.0) == 1.0
+    db.commit()
+    counters = db.query(BudgetCounter).filter(BudgetCounter.user_id == user["id"]).all()
+    assert sorted((c.month, c.spent) for c in counters) == [(month, 12.5), (date(2024, 4, 1), 1.0)]
+
+def test_transactions_update_the_counter_and_deletes_reverse_it(client, user):
+    set_budget(client, user, 100)
+    lunch = spend(client, user, -30)
+    spend(client, user, -12)
+    spend(client, user, 20)  # Refunds and income aren't spending
+    spend(client, user, -500, category="salary")
+    assert spent(client, user) == 42
+
+    assert client.delete(f"/api/transactions/{lunch['id']}", headers=user["headers"]).status_code == 204
+    assert spent(client, user) == 12
+
+def test_csv_upload_adds_one_delta_per_category_and_month(client, user, db):
+    last_month = (month_start(None) - timedelta(days=1)).isoformat()
+    now = datetime.now(timezone.utc).isoformat()
+    csv = (
+        "amount,category,description,timestamp\n"
+        f"-10,food,a,{now}\n-15.5,food,b,{now}\n-4,food,c,{last_month}\n-60,rent,d,{now}\n"
+    )
+    response = client.post(
+        f"/api/transactions/upload?account_id={user['account_id']}",
+        files={"file": ("t.csv", csv.encode(), "text/csv")},
+        headers=user["headers"]
+    )
+    assert response.status_code == 200
+
+    counters = {
+        (c.category, c.month): c.spent
+        for c in db.query(BudgetCounter).filter(BudgetCounter.user_id == user["id"]).all()
+    }
+    this_month = month_start(None)
+    assert counters == {
+        (FOOD, this_month): 25.5,
+        (FOOD, date.fromisoformat(last_month).replace(day=1)): 4,
+        (TransactionCategory.RENT, this_month): 60,
+    }
+
+def test_alerts_fire_once_per_threshold_crossed(client, user):
+    set_budget(client, user, 100, threshold=0.8)
+    spend(client, user, -50)
+    assert alerts(client, user) == []
+    spend(client, user, -35)
+    assert alerts(client, user) == [0.8]
+    spend(client, user, -20)
+    assert alerts(client, user) == [0.8, 1.0]
+    spend(client, user, -5)
+    assert alerts(client, user) == [0.8, 1.0]
+
+def test_one_write_can_cross_both_thresholds(client, user):
+    set_budget(client, user, 100, threshold=0.5)
+    spend(client, user, -120)
+    assert alerts(client, user) == [0.5, 1.0]
+
+def test_sinks_see_alerts_only_after_commit(monkeypatch, user, db):
+    received = []
+    monkeypatch.setattr(budgets, "_alert_sinks", [received.append])
+    db.add(Budget(user_id=user["id"], category=FOOD, monthly_limit=100, alert_threshold=0.8))
+    db.commit()
+
+    record_spending(db, user["id"], [(FOOD, None, -90)])
+    assert received == []
+    db.commit()
+    assert [(a["threshold"], a["spent"]) for a in received] == [(0.8, 90)]
+
+    # A rolled-back crossing is neither dispatched nor kept in the outbox
+    record_spending(db, user["id"], [(FOOD, None, -20)])
+    db.rollback()
+    assert len(received) == 1
+    assert db.query(BudgetAlert).filter(BudgetAlert.user_id == user["id"]).count() == 1
+
+def test_set_budget_seeds_from_existing_transactions_once(client, user, db):
+    # Written before counters existed: no counter row for this month
+    now = datetime.now(timezone.utc)
+    db.add_all([
+        Transaction(account_id=user["account_id"], amount=-40, category=FOOD, timestamp=now),
+        Transaction(account_id=user["account_id"], amount=-2.5, category=FOOD, timestamp=now),
+        Transaction(account_id=user["account_id"], amount=-99, category=FOOD, timestamp=now - timedelta(days=40)),
+        Transaction(account_id=user["account_id"], amount=-7, category=TransactionCategory.RENT, timestamp=now),
+    ])
+    db.commit()
+
+    assert set_budget(client, user, 200)["spent"] == 42.5
+    assert set_budget(client, user, 300)["spent"] == 42.5
+    assert spent(client, user) == 42.5
@@ -0,0 +1,132 @@
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app.database import Base
+from app.forecast import detect_series, note_transaction, project_balances, series_key
+from app.models import Account, AccountType, RecurringScan, RecurringSeries, TransactionCategory, User
+
+NOW = datetime(2024, 6, 30, tzinfo=timezone.utc)
+
+def history(*groups):
+    """Rows for (description, amount, category, [days before NOW]) groups on one account."""
+    return pd.DataFrame([
+        {"user_id": 1, "account_id": 10, "amount": amount, "category": category,
+         "description": description, "timestamp": NOW - timedelta(days=days)}
+        for description, amount, category, days_ago in groups
+        for days in days_ago
+    ])
+
+def detected(frame):
+    series = detect_series(frame, NOW)
+    return {row.description: row for row in series.itertuples(index=False)} if not series.empty else {}
+
+def test_detects_monthly_and_biweekly_series():
+    series = detected(history(
+        ("RENT PAYMENT 0412", -1500, "rent", [1, 31, 62, 92, 123, 153]),
+        ("ACME PAYROLL", 2100, "salary", [3, 17, 31, 45, 59]),
+    ))
+    rent, salary = series["RENT PAYMENT 0412"], series["ACME PAYROLL"]
+    assert (rent.period_days, rent.occurrences, rent.amount) == (30.44, 6, -1500)
+    assert rent.next_expected == rent.last_seen + timedelta(days=30.44)
+    assert (salary.period_days, salary.occurrences) == (14.0, 5)
+
+def test_amounts_in_one_band_form_one_series():
+    series = detected(history(("Netflix.com 881", -15.49, "entertainment", [2, 32, 63]),
+                              ("NETFLIX.COM 902", -15.99, "entertainment", [93])))
+    assert len(series) == 1
+    assert next(iter(series.values())).occurrences == 4
+
+def test_irregular_and_too_short_histories_are_rejected():
+    assert detected(history(
+        ("CORNER SHOP", -12, "food", [1, 6, 46, 58, 83, 87]),
+        ("GYM", -40, "healthcare", [1, 31]),
+    )) == {}
+
+def test_mostly_regular_series_with_one_outlier_is_kept():
+    # Four of five intervals sit on the period: regularity 0.8
+    series = detected(history(("PHONE BILL", -50, "utilities", [1, 31, 61, 91, 121, 161])))
+    assert series["PHONE BILL"].period_days == 30.44
+
+def test_lapsed_series_has_ended():
+    assert detected(history(("OLD SUBSCRIPTION", -9, "entertainment", [70, 100, 130, 160]))) == {}
+    # Within two periods of the last occurrence it is still live
+    assert "OLD SUBSCRIPTION" in detected(history(("OLD SUBSCRIPTION", -9, "entertainment", [50, 80, 110])))
+
+def test_empty_history():
+    assert detect_series(history(), NOW).empty
+
+def recurring(account_id, amount, period_days, next_expected):
+    return SimpleNamespace(account_id=account_id, amount=amount, period_days=period_days, next_expected=next_expected)
+
+def test_projection_places_occurrences_inside_the_horizon():
+    start = date(2024, 7, 1)
+    start_dt = datetime(2024, 7, 1, tzinfo=timezone.utc)
+    accounts = [SimpleNamespace(id=10, balance=1000.0), SimpleNamespace(id=11, balance=50.0)]
+    series = [
+        recurring(10, -100.0, 30.0, start_dt + timedelta(days=5)),
+        # Overdue: the first occurrence rolls forward to day 4, then every 14 days
+        recurring(11, 20.0, 14.0, start_dt - timedelta(days=10)),
+        # Another user's account is ignored
+        recurring(99, -1e6, 7.0, start_dt),
+    ]
+    balances = project_balances(accounts, series, start, days=90)
+
+    checking = balances[10]
+    assert len(checking) == 91
+    assert checking[4] == 1000 and checking[5] == 900
+    assert checking[34] == 900 and checking[35] == 800
+    assert checking[90] == 700
+
+    savings = balances[11]
+    assert savings[3] == 50 and savings[4] == 70
+    # Days 4, 18, ..., 88
+    assert savings[90] == 50 + 7 * 20
+
+def test_projection_without_accounts():
+    assert project_balances([], [recurring(10, -1.0, 7.0, NOW)], NOW.date()) == {}
+
+@pytest.fixture
+def db(sqlite_url, request):
+    engine = create_engine(sqlite_url(f"forecast-{request.node.name}"))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = Session(bind=engine)
+    db.add(User(id=1, username="forecast", hashed_password="x"))
+    db.add(Account(id=10, user_id=1, type=AccountType.CHECKING, institution_name="Bank", balance=0))
+    db.add(RecurringSeries(
+        user_id=1, account_id=10, key=series_key("RENT PAYMENT", -1500), description="RENT PAYMENT",
+        category=TransactionCategory.RENT, amount=-1500, period_days=30.44, occurrences=4,
+        last_seen=NOW - timedelta(days=30), next_expected=NOW
+    ))
+    db.add(RecurringScan(user_id=1, stale=False, scanned_at=NOW))
+    db.commit()
+    yield db
+    db.close()
+    engine.dispose()
+
+def scan_is_stale(db):
+    db.expire_all()
+    return db.get(RecurringScan, 1).stale
+
+def test_expected_occurrence_advances_the_series(db):
+    paid = NOW + timedelta(days=2)
+    note_transaction(db, 1, 10, -1500, "RENT PAYMENT 0713", paid)
+    db.commit()
+    rent = db.query(RecurringSeries).one()
+    assert rent.occurrences == 5
+    assert rent.last_seen.replace(tzinfo=timezone.utc) == paid
+    assert not scan_is_stale(db)
+
+@pytest.mark.parametrize("account_id, amount, description, days_late", [
+    (10, -1500, "RENT PAYMENT", 10),  # Outside the monthly tolerance
+    (10, -2500, "RENT PAYMENT", 0),   # Different amount band
+    (10, -1500, "LANDLORD", 0),       # Unknown description
+])
+def test_anything_else_marks_the_user_for_rescan(db, account_id, amount, description, days_late):
+    note_transaction(db, 1, account_id, amount, description, NOW + timedelta(days=days_late))
+    db.commit()
+    assert db.query(RecurringSeries).one().occurrences == 4
+    assert scan_is_stale(db)
@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app.database import Base
+from app.health_score import WEIGHTS, component_scores, compute_metrics, overall_score
+from app.models import Account, AccountType, Portfolio, Transaction, TransactionCategory, User
+
+SALARY = TransactionCategory.SALARY
+FOOD = TransactionCategory.FOOD
+
+@pytest.fixture
+def db(sqlite_url, request):
+    engine = create_engine(sqlite_url(f"health-{request.node.name}"))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = Session(bind=engine)
+    yield db
+    db.close()
+    engine.dispose()
+
+def months_ago(n: int) -> datetime:
+    """The 10th of the month n complete months back."""
+    now = datetime.now(timezone.utc)
+    year, month = divmod(now.year * 12 + now.month - 1 - n, 12)
+    return datetime(year, month + 1, 10, tzinfo=timezone.utc)
+
+def add_user(db, user_id, accounts=(), transactions=(), holdings=()):
+    db.add(User(id=user_id, username=f"health{user_id}", hashed_password="x"))
+    for account_id, (type_, balance) in enumerate(accounts, start=user_id * 10):
+        db.add(Account(id=account_id, user_id=user_id, type=type_, institution_name="Bank", balance=balance))
+    for amount, category, months in transactions:
+        db.add(Transaction(account_id=user_id * 10, amount=amount, category=category, timestamp=months_ago(months)))
+    for ticker, shares, cost in holdings:
+        db.add(Portfolio(user_id=user_id, ticker_symbol=ticker, shares_owned=shares, cost_basis=cost))
+    db.flush()
+
+def metrics_for(db, user_id):
+    metrics = compute_metrics(db, [user_id])
+    components = component_scores(metrics)
+    return (
+        {name: float(metrics[name][0]) for name in WEIGHTS},
+        {name: float(components[name][0]) for name in WEIGHTS},
+    )
+
+def test_steady_saver_with_diversified_holdings(db):
+    add_user(
+        db, 1,
+        accounts=[(AccountType.CHECKING, 12000), (AccountType.BROKERAGE, 8000), (AccountType.LOAN, 5000)],
+        transactions=[(4000, SALARY, m) for m in range(1, 7)] + [(-2000, FOOD, m) for m in range(1, 7)],
+        holdings=[("AAPL", 10, 100), ("MSFT", 5, 200)],
+    )
+    metrics, components = metrics_for(db, 1)
+    assert metrics["savings_rate"] == pytest.approx(0.5)
+    assert metrics["debt_to_asset_ratio"] == pytest.approx(0.25)
+    assert metrics["emergency_fund_months"] == pytest.approx(6)
+    assert metrics["spending_volatility"] == pytest.approx(0)
+    assert metrics["diversification"] == pytest.approx(0.5)
+    assert components["savings_rate"] == components["emergency_fund_months"] == 100
+
+def test_no_income_scores_zero_savings(db):
+    add_user(db, 1, accounts=[(AccountType.CHECKING, 600)], transactions=[(-100, FOOD, 1), (-300, FOOD, 2)])
+    metrics, components = metrics_for(db, 1)
+    assert metrics["savings_rate"] == 0
+    assert components["savings_rate"] == 0
+    # 600 liquid against 400 / 6 a month
+    assert metrics["emergency_fund_months"] == pytest.approx(9)
+    assert metrics["spending_volatility"] > 0
+
+def test_loan_only_user_has_no_assets(db):
+    add_user(db, 1, accounts=[(AccountType.LOAN, 20000)])
+    metrics, components = metrics_for(db, 1)
+    assert metrics["debt_to_asset_ratio"] == 1
+    assert metrics["emergency_fund_months"] == 0
+    assert components["debt_to_asset_ratio"] == components["emergency_fund_months"] == 0
+
+def test_user_without_accounts_or_holdings(db):
+    add_user(db, 1)
+    metrics, components = metrics_for(db, 1)
+    assert metrics["debt_to_asset_ratio"] == 0
+    assert np.isnan(metrics["diversification"])
+    # No holdings is neutral rather than a penalty
+    assert components["diversification"] == 50
+    assert all(0 <= value <= 100 for value in components.values())
+
+def test_users_are_aligned_with_sorted_ids(db):
+    add_user(db, 7, accounts=[(AccountType.LOAN, 100)])
+    add_user(db, 3, accounts=[(AccountType.CHECKING, 100)], holdings=[("AAPL", 1, 10)])
+    metrics = compute_metrics(db, [7, 3])
+    assert metrics["user_id"].tolist() == [3, 7]
+    assert metrics["debt_to_asset_ratio"].tolist() == [0, 1]
+    assert metrics["diversification"][0] == 0
+    assert overall_score(component_scores(metrics)).shape == (2,)
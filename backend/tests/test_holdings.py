@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app.database import Base
+from app.holdings import add_lots, ensure_position_index, has_position_index
+from app.models import Portfolio, PortfolioLot, User
+
+@pytest.fixture
+def legacy_db(sqlite_url, request):
+    """A database upgraded from before lots existed: no unique position index."""
+    engine = create_engine(sqlite_url(f"legacy-{request.node.name}"))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_portfolios_user_ticker"))
+    db = Session(bind=engine)
+    db.add(User(id=1, username="legacy", hashed_password="x"))
+    db.add(Portfolio(user_id=1, ticker_symbol="AAPL", shares_owned=10, cost_basis=100))
+    db.commit()
+    yield db
+    db.close()
+    engine.dispose()
+
+def position(db, ticker):
+    return db.query(Portfolio).filter(Portfolio.user_id == 1, Portfolio.ticker_symbol == ticker).one()
+
+def test_buying_works_before_the_index_exists(legacy_db):
+    legacy_db.add(Portfolio(user_id=1, ticker_symbol="AAPL", shares_owned=5, cost_basis=130))
+    legacy_db.commit()
+    assert not has_position_index(legacy_db)
+
+    add_lots(legacy_db, 1, [("MSFT", 2, 300.0, None), ("MSFT", 2, 320.0, None)])
+    legacy_db.commit()
+    msft = position(legacy_db, "MSFT")
+    assert (msft.shares_owned, msft.cost_basis) == (4, 310)
+
+def test_startup_adds_the_index_when_there_are_no_duplicates(legacy_db):
+    assert ensure_position_index(legacy_db)
+    assert has_position_index(legacy_db)
+    assert legacy_db.query(PortfolioLot).count() == 1
+
+    add_lots(legacy_db, 1, [("AAPL", 10, 120.0, None)])
+    legacy_db.commit()
+    aapl = position(legacy_db, "AAPL")
+    assert (aapl.shares_owned, aapl.cost_basis) == (20, 110)
+
+def test_startup_leaves_duplicates_for_consolidate(legacy_db):
+    legacy_db.add(Portfolio(user_id=1, ticker_symbol="AAPL", shares_owned=5, cost_basis=130))
+    legacy_db.commit()
+
+    assert not ensure_position_index(legacy_db)
+    assert legacy_db.query(Portfolio).count() == 2
@@ -0,0 +1,129 @@
+"""
+Partitioning runs on PostgreSQL only. Point TEST_POSTGRES_URL at a scratch
+database to run these; the tables live in their own schema, dropped afterwards.
+"""
+import os
+from datetime import date, datetime, timedelta, timezone
+import pytest
+from sqlalchemy import create_engine, text
+from app import partitioning
+from app.partitioning import (
+    archive_transaction_partitions,
+    ensure_partitions_for,
+    ensure_transaction_partitions,
+    list_transaction_partitions,
+    partition_name,
+    read_archived_transactions,
+    scanned_partitions,
+)
+
+SCHEMA = "finpulse_partition_test"
+
+@pytest.fixture
+def pg_engine(monkeypatch):
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("set TEST_POSTGRES_URL to run partitioning tests against PostgreSQL")
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(
+            "CREATE TABLE transactions ("
+            " id serial, account_id integer NOT NULL, amount double precision NOT NULL,"
+            " category text NOT NULL, description text,"
+            " timestamp timestamptz NOT NULL DEFAULT now(), created_at timestamptz DEFAULT now(),"
+            " PRIMARY KEY (id, timestamp)"
+            ") PARTITION BY RANGE (timestamp)"
+        ))
+    monkeypatch.setattr(partitioning, "TRANSACTIONS_PARTITIONED", True)
+    monkeypatch.setattr(partitioning, "_known_partitions", {})
+    yield engine
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    engine.dispose()
+
+def insert(conn, account_id: int, timestamp: datetime, description=None):
+    conn.execute(
+        text(
+            "INSERT INTO transactions (account_id, amount, category, description, timestamp) "
+            "VALUES (:account_id, -10, 'FOOD', :description, :timestamp)"
+        ),
+        {"account_id": account_id, "description": description, "timestamp": timestamp},
+    )
+
+def partition_of(conn, timestamp: datetime) -> str:
+    return conn.execute(
+        text("SELECT tableoid::regclass::text FROM transactions WHERE timestamp = :ts"), {"ts": timestamp}
+    ).scalar()
+
+def months_between(start: date, end: date):
+    month = start.replace(day=1)
+    while month <= end:
+        yield month
+        month = partitioning._add_months(month, 1)
+
+def test_recent_window_scans_only_recent_partitions(pg_engine):
+    ensure_transaction_partitions(pg_engine, months_ahead=3, months_back=6)
+    now = datetime.now(timezone.utc)
+    with pg_engine.begin() as conn:
+        for days_ago in (0, 20, 45, 100, 170):
+            insert(conn, 1, now - timedelta(days=days_ago))
+        conn.execute(text("ANALYZE transactions"))
+
+    since = now - timedelta(days=30)
+    expected = sorted(partition_name(m) for m in months_between(since.date(), now.date()))
+    assert scanned_partitions(pg_engine, since) == expected
+    assert len(list_transaction_partitions(pg_engine)) == 10
+
+def test_back_dated_rows_get_their_own_partition(pg_engine):
+    old = datetime(2019, 5, 17, 12, 0, tzinfo=timezone.utc)
+    with pg_engine.begin() as conn:
+        assert ensure_partitions_for(conn, [old]) == ["transactions_y2019m05"]
+        insert(conn, 1, old)
+        assert partition_of(conn, old) == "transactions_y2019m05"
+    with pg_engine.begin() as conn:
+        # Now known to exist: no DDL, no lock
+        assert ensure_partitions_for(conn, [old + timedelta(days=3)]) == []
+
+def test_default_partition_rows_move_to_monthly_partitions(pg_engine):
+    old = datetime(2018, 3, 9, tzinfo=timezone.utc)
+    with pg_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE transactions_default PARTITION OF transactions DEFAULT"))
+        insert(conn, 1, old)
+
+    created = ensure_transaction_partitions(pg_engine, months_ahead=0)
+    assert "transactions_y2018m03" in created
+    with pg_engine.connect() as conn:
+        assert conn.execute(text("SELECT to_regclass('transactions_default')")).scalar() is None
+        assert partition_of(conn, old) == "transactions_y2018m03"
+
+def test_archive_round_trip_with_null_descriptions(pg_engine, tmp_path):
+    pytest.importorskip("pyarrow")
+    old = datetime(2017, 8, 2, tzinfo=timezone.utc)
+    with pg_engine.begin() as conn:
+        ensure_partitions_for(conn, [old])
+        insert(conn, 7, old)
+        insert(conn, 7, old + timedelta(days=1))
+        insert(conn, 8, old + timedelta(days=2), description="other account")
+
+    paths = archive_transaction_partitions(pg_engine, horizon_months=24, archive_dir=str(tmp_path))
+    assert [os.path.basename(p) for p in paths] == ["transactions_2017_08.parquet"]
+    assert "transactions_y2017m08" not in [name for name, _ in list_transaction_partitions(pg_engine)]
+    archived = read_archived_transactions([7], str(tmp_path))
+    assert len(archived) == 2
+    assert archived["description"].isna().all()
+
+def test_archived_categories_are_api_values(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    pd.DataFrame([
+        {"id": 1, "account_id": 3, "amount": -4.5, "category": "FOOD", "description": None,
+         "timestamp": pd.Timestamp("2020-01-05", tz="UTC"), "created_at": None},
+        {"id": 2, "account_id": 4, "amount": 900.0, "category": "SALARY", "description": "pay",
+         "timestamp": pd.Timestamp("2020-01-06", tz="UTC"), "created_at": None},
+    ]).to_parquet(tmp_path / "transactions_2020_01.parquet", index=False)
+
+    archived = read_archived_transactions([3], str(tmp_path))
+    assert archived["category"].tolist() == ["food"]
+    assert read_archived_transactions([], str(tmp_path)).empty
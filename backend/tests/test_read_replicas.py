@@ -0,0 +1,154 @@
+import time
+from contextlib import ExitStack
+import pytest
+from sqlalchemy import event, text
+from app import database
+from app.database import Base, ReplicaPool, engine, get_db, get_read_db, shards
+from app.models import User
+from tests.conftest import make_request, register
+
+BROKEN_URL = "sqlite:////nonexistent-dir/replica.db"
+
+def open_session(dependency, request):
+    """Resolve a session dependency as FastAPI would; close the returned stack to tear it down."""
+    sessions = ExitStack()
+    def resolve(dep, *args):
+        generator = dep(request, *args)
+        sessions.callback(generator.close)
+        return next(generator)
+    if dependency is get_read_db:
+        return sessions, resolve(get_read_db, resolve(get_db))
+    return sessions, resolve(dependency)
+
+@pytest.fixture
+def replicas(monkeypatch, sqlite_url):
+    def configure(*urls, retry_seconds=30.0):
+        pool = ReplicaPool(list(urls), retry_seconds)
+        monkeypatch.setattr(shards[0], "replicas", pool)
+        return pool
+    return configure
+
+def test_read_session_uses_a_replica(replicas, sqlite_url):
+    pool = replicas(sqlite_url("replica1"))
+    sessions, db = open_session(get_read_db, make_request())
+    try:
+        assert db.get_bind().engine is pool.engines[0]
+    finally:
+        sessions.close()
+
+def test_replicas_are_used_round_robin(replicas, sqlite_url):
+    pool = replicas(sqlite_url("replica1"), sqlite_url("replica2"))
+    binds = []
+    for _ in range(4):
+        sessions, db = open_session(get_read_db, make_request())
+        binds.append(db.get_bind())
+        sessions.close()
+    assert binds == [pool.engines[0], pool.engines[1], pool.engines[0], pool.engines[1]]
+
+def test_write_session_uses_the_primary(replicas, sqlite_url):
+    replicas(sqlite_url("replica1"))
+    sessions, db = open_session(get_db, make_request())
+    try:
+        assert db.get_bind().engine is database.engine
+    finally:
+        sessions.close()
+
+def test_reads_stay_on_primary_after_a_write(replicas, sqlite_url):
+    pool = replicas(sqlite_url("replica1"))
+    writer = make_request("client-writes")
+    sessions, db = open_session(get_db, writer)
+    db.add(User(username=f"writer-{time.monotonic_ns()}", hashed_password="x"))
+    db.commit()
+    sessions.close()
+
+    sessions, db = open_session(get_read_db, make_request("client-writes"))
+    assert db.get_bind().engine is database.engine
+    sessions.close()
+
+    # Other clients are unaffected
+    sessions, db = open_session(get_read_db, make_request("client-other"))
+    assert db.get_bind().engine is pool.engines[0]
+    sessions.close()
+
+def test_stickiness_expires(replicas, sqlite_url, monkeypatch):
+    pool = replicas(sqlite_url("replica1"))
+    key = "Bearer client-expired"
+    monkeypatch.setitem(database._recent_writes, key, time.monotonic() - database.READ_AFTER_WRITE_SECONDS - 1)
+    sessions, db = open_session(get_read_db, make_request("client-expired"))
+    assert db.get_bind().engine is pool.engines[0]
+    sessions.close()
+
+def test_unreachable_replica_is_skipped(replicas, sqlite_url):
+    pool = replicas(BROKEN_URL, sqlite_url("replica1"))
+    for _ in range(3):
+        sessions, db = open_session(get_read_db, make_request())
+        assert db.get_bind().engine is pool.engines[1]
+        sessions.close()
+
+def test_falls_back_to_primary_when_no_replica_is_reachable(replicas):
+    replicas(BROKEN_URL)
+    sessions, db = open_session(get_read_db, make_request())
+    try:
+        assert db.get_bind().engine is database.engine
+        assert db.query(User).count() >= 0
+    finally:
+        sessions.close()
+
+def test_primary_reads_share_the_request_connection(replicas):
+    replicas()
+    sessions, db = open_session(get_read_db, make_request())
+    try:
+        db.query(User).count()
+        assert db.get_bind() is db.info["primary_session"].connection()
+        assert engine.pool.checkedout() == 1
+    finally:
+        sessions.close()
+    assert engine.pool.checkedout() == 0
+
+def test_failed_replica_is_retried_after_retry_period(replicas, sqlite_url):
+    pool = replicas(BROKEN_URL, retry_seconds=0.2)
+    sessions, db = open_session(get_read_db, make_request())
+    assert db.get_bind().engine is database.engine
+    sessions.close()
+    assert pool.choose() is None
+
+    # Once it recovers, the first read after the retry period uses it again
+    pool.engines[0] = ReplicaPool([sqlite_url("replica1")], 0.0).engines[0]
+    time.sleep(0.25)
+    sessions, db = open_session(get_read_db, make_request())
+    assert db.get_bind() is pool.engines[0]
+    sessions.close()
+
+def test_replica_reads_take_one_checkout(replicas, sqlite_url):
+    pool = replicas(sqlite_url("replica1"))
+    checkouts = []
+    event.listen(pool.engines[0], "checkout", lambda *args: checkouts.append(args))
+    sessions, db = open_session(get_read_db, make_request())
+    try:
+        db.execute(text("SELECT 1"))
+    finally:
+        sessions.close()
+    assert len(checkouts) == 1
+
+def test_reads_after_a_write_stay_on_primary_on_another_worker(client, monkeypatch, sqlite_url):
+    # Replicas that haven't caught up: schema only, no rows
+    for shard in shards:
+        pool = ReplicaPool([sqlite_url(f"lagging-replica-{shard.id}")], 30.0)
+        Base.metadata.create_all(bind=pool.engines[0])
+        monkeypatch.setattr(shard, "replicas", pool)
+    user = register(client)
+    created = client.post(
+        "/api/accounts/",
+        json={"type": "checking", "institution_name": "Bank", "balance": 10},
+        headers=user["headers"]
+    )
+    assert created.status_code == 201
+
+    # Another worker: no in-process record of the write, only the client's cookie
+    monkeypatch.setattr(database, "_recent_writes", {})
+    accounts = client.get("/api/accounts/", headers=user["headers"]).json()
+    assert [a["id"] for a in accounts] == [created.json()["id"]]
+
+    # Without the cookie that worker would have read from the lagging replica
+    client.cookies.clear()
+    assert client.get("/api/accounts/", headers=user["headers"]).json() == []
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+import uuid
+import pytest
+from fastapi import HTTPException
+from app import security
+from app.database import SessionLocal
+from app.models import RefreshToken, User
+from app.security import issue_tokens, rotate_refresh_token
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def refresh_token(db):
+    user = User(
+        username=f"tabs-{uuid.uuid4().hex[:8]}",
+        hashed_password="not-used"
+    )
+    db.add(user)
+    db.flush()
+    tokens, _ = issue_tokens(db, user)
+    db.commit()
+    return tokens["refresh_token"]
+
+def active_tokens(db, token: str) -> int:
+    family_id = db.query(RefreshToken.family_id).filter(
+        RefreshToken.token_hash == security.hash_refresh_token(token)
+    ).scalar()
+    return db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).count()
+
+def test_concurrent_refresh_within_grace_keeps_session(db, refresh_token):
+    _, first = rotate_refresh_token(db, refresh_token)
+    # A second tab presents the same, just-rotated token
+    _, second = rotate_refresh_token(db, refresh_token)
+
+    assert second["access_token"]
+    assert second.get("refresh_token") is None
+    assert active_tokens(db, refresh_token) == 1
+    # The winning tab's successor still rotates normally
+    _, third = rotate_refresh_token(db, first["refresh_token"])
+    assert active_tokens(db, refresh_token) == 1
+    assert third["refresh_token"]
+
+def test_reuse_after_grace_revokes_family(db, refresh_token):
+    _, tokens = rotate_refresh_token(db, refresh_token)
+    db.query(RefreshToken).filter(
+        RefreshToken.token_hash == security.hash_refresh_token(refresh_token)
+    ).update({RefreshToken.revoked_at: datetime.now(timezone.utc) - timedelta(minutes=5)})
+    db.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        rotate_refresh_token(db, refresh_token)
+    assert exc.value.status_code == 401
+    assert active_tokens(db, refresh_token) == 0
+    with pytest.raises(HTTPException):
+        rotate_refresh_token(db, tokens["refresh_token"])
+
+def test_logged_out_token_is_not_accepted_within_grace(db, refresh_token):
+    rotate_refresh_token(db, refresh_token)
+    family_id = db.query(RefreshToken.family_id).filter(
+        RefreshToken.token_hash == security.hash_refresh_token(refresh_token)
+    ).scalar()
+    security.revoke_token_family(db, family_id)
+    db.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        rotate_refresh_token(db, refresh_token)
+    assert exc.value.status_code == 401
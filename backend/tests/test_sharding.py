@@ -0,0 +1,90 @@
+import os
+import pytest
+from sqlalchemy import select
+from app import sharding
+from app.database import shards
+from app.models import Account, Transaction, User
+from app.partitioning import shard_archive_dir
+from app.sharding import DirectorySession, UserShard, move_user
+from tests.conftest import register
+
+
+def shard_of(user_id: int) -> int:
+    directory = DirectorySession()
+    try:
+        return directory.get(UserShard, user_id).shard_id
+    finally:
+        directory.close()
+
+def rows_on(shard_id: int, model, **filters) -> list:
+    with shards[shard_id].engine.connect() as conn:
+        table = model.__table__
+        query = select(table).where(*(table.c[k] == v for k, v in filters.items()))
+        return conn.execute(query).all()
+
+def add_account(client, user) -> int:
+    account = client.post(
+        "/api/accounts/",
+        json={"type": "checking", "institution_name": "Bank", "balance": 100},
+        headers=user["headers"]
+    ).json()
+    client.post(
+        "/api/transactions/",
+        json={"account_id": account["id"], "amount": -12.5, "category": "food"},
+        headers=user["headers"]
+    )
+    return account["id"]
+
+def test_registration_spreads_users_over_shards(client):
+    users = [register(client) for _ in range(4)]
+    placements = {user["id"]: shard_of(user["id"]) for user in users}
+
+    assert set(placements.values()) == {0, 1}
+    for user_id, shard_id in placements.items():
+        assert rows_on(shard_id, User, id=user_id)
+        assert not rows_on(1 - shard_id, User, id=user_id)
+
+def test_requests_use_the_users_shard(client):
+    user = register(client)
+    shard_id = shard_of(user["id"])
+    account_id = add_account(client, user)
+
+    assert rows_on(shard_id, Account, id=account_id, user_id=user["id"])
+    assert not rows_on(1 - shard_id, Account, user_id=user["id"])
+    accounts = client.get("/api/accounts/", headers=user["headers"]).json()
+    assert [a["id"] for a in accounts] == [account_id]
+
+def test_move_user_copies_rows_and_reroutes(client):
+    user = register(client)
+    source = shard_of(user["id"])
+    add_account(client, user)
+
+    move_user(user["id"], 1 - source, drain_seconds=0)
+    sharding._cache.clear()
+
+    assert shard_of(user["id"]) == 1 - source
+    assert not rows_on(source, User, id=user["id"])
+    assert not rows_on(source, Account, user_id=user["id"])
+    accounts = client.get("/api/accounts/", headers=user["headers"]).json()
+    assert len(accounts) == 1
+    transactions = client.get("/api/transactions/", headers=user["headers"]).json()
+    assert [t["account_id"] for t in transactions] == [accounts[0]["id"]]
+    assert transactions[0]["amount"] == -12.5
+
+def test_move_refuses_users_with_archived_transactions(client):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    user = register(client)
+    source = shard_of(user["id"])
+    account_id = add_account(client, user)
+    archive_dir = shard_archive_dir(source)
+    os.makedirs(archive_dir, exist_ok=True)
+    pd.DataFrame([{
+        "id": 1, "account_id": account_id, "amount": -1.0, "category": "FOOD",
+        "description": None, "timestamp": pd.Timestamp("2020-01-05", tz="UTC"), "created_at": None,
+    }]).to_parquet(f"{archive_dir}/transactions_2020_01.parquet", index=False)
+
+    with pytest.raises(RuntimeError):
+        move_user(user["id"], 1 - source, drain_seconds=0)
+    assert shard_of(user["id"]) == source
+    assert rows_on(source, Transaction, account_id=account_id)
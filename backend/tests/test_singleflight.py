@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from datetime import date
+from types import SimpleNamespace
+import pytest
+from fastapi import Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.database import SessionLocal, engine
+from app.singleflight import coalesced, single_flight
+
+USER = SimpleNamespace(id=1)
+
+def request_session():
+    db = SessionLocal(info={"client": "Bearer client-a"})
+    # As after get_current_user: the request session holds a connection
+    db.execute(text("SELECT 1"))
+    return db
+
+def test_callers_share_one_computation_on_its_own_session():
+    calls = []
+
+    @coalesced
+    def summary(current_user=None, db: Session = None):
+        calls.append(db)
+        time.sleep(0.1)
+        return db.execute(text("SELECT 42")).scalar()
+
+    async def run():
+        dbs = [request_session(), request_session()]
+        results = await asyncio.gather(*(summary(current_user=USER, db=db) for db in dbs))
+        return dbs, results
+
+    dbs, results = asyncio.run(run())
+    assert results == [42, 42]
+    assert len(calls) == 1
+    assert calls[0] not in dbs
+    assert engine.pool.checkedout() == 0
+
+def test_timed_out_leader_does_not_leak_its_connection(monkeypatch):
+    monkeypatch.setattr(single_flight, "timeout", 0.05)
+    release = threading.Event()
+
+    @coalesced
+    def slow_summary(current_user=None, db: Session = None):
+        db.execute(text("SELECT 1"))
+        release.wait(5)
+        return db.execute(text("SELECT 1")).scalar()
+
+    async def run():
+        with pytest.raises(HTTPException) as exc:
+            await slow_summary(current_user=SimpleNamespace(id=2), db=request_session())
+        assert exc.value.status_code == 504
+        # Only the computation's own session is still open
+        assert engine.pool.checkedout() == 1
+        release.set()
+        for _ in range(100):
+            if not single_flight.stats()["in_flight"]:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert engine.pool.checkedout() == 0
+
+def test_key_includes_user_and_every_parameter():
+    calls = []
+
+    @coalesced
+    async def report(current_user=None, since: date = None, tickers: list = None):
+        calls.append((current_user.id, since, tickers))
+        await asyncio.sleep(0.05)
+        return (current_user.id, since, tickers)
+
+    requests = [
+        dict(current_user=USER, since=date(2024, 1, 1), tickers=["AAPL"]),
+        dict(current_user=USER, since=date(2024, 1, 1), tickers=["AAPL"]),
+        dict(current_user=USER, since=date(2024, 2, 1), tickers=["AAPL"]),
+        dict(current_user=USER, since=date(2024, 1, 1), tickers=["MSFT"]),
+        dict(current_user=SimpleNamespace(id=2), since=date(2024, 1, 1), tickers=["AAPL"]),
+    ]
+
+    async def run():
+        return await asyncio.gather(*(report(**kwargs) for kwargs in requests))
+
+    results = asyncio.run(run())
+    assert len(calls) == 4
+    assert results == [(r["current_user"].id, r["since"], r["tickers"]) for r in requests]
+
+def test_routes_that_cannot_be_keyed_are_rejected():
+    with pytest.raises(TypeError):
+        @coalesced
+        def no_user(user=None, db: Session = None):
+            pass
+
+    with pytest.raises(TypeError):
+        @coalesced
+        def opaque_dependency(current_user=None, settings=Depends(dict)):
+            pass
@@ -20,6 +20,7 @@ export default function Login() {
     try {
       const response = await authAPI.login({ username, password })
       localStorage.setItem('token', response.access_token)
+      localStorage.setItem('refresh_token', response.refresh_token)
       navigate('/dashboard')
     } catch (err: any) {
       setError(err.response?.data?.detail || 'Login failed')
@@ -4,6 +4,8 @@ const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
 
 const api = axios.create({
   baseURL: API_URL,
+  // Sends the read-after-write cookie so reads after a write stay on the primary
+  withCredentials: true,
   headers: {
     'Content-Type': 'application/json',
   },
@@ -18,12 +20,40 @@ api.interceptors.request.use((config) => {
   return config
 })
 
-// Handle token expiration
+// Handle token expiration: rotate the refresh token once, otherwise log out
+let refreshing: Promise<string> | null = null
+
+const refreshAccessToken = async (): Promise<string> => {
+  const refreshToken = localStorage.getItem('refresh_token')
+  if (!refreshToken) throw new Error('No refresh token')
+  const response = await axios.post(`${API_URL}/api/auth/refresh`, { refresh_token: refreshToken })
+  localStorage.setItem('token', response.data.access_token)
+  // Omitted when another tab already rotated this token and stored the new one
+  if (response.data.refresh_token) {
+    localStorage.setItem('refresh_token', response.data.refresh_token)
+  }
+  return response.data.access_token
+}
+
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
+    const original = error.config
+    if (error.response?.status === 401 && original && !original._retried && !original.url?.startsWith('/api/auth/')) {
+      original._retried = true
+      try {
+        // Share one refresh between concurrent 401s so the token rotates once
+        refreshing = refreshing || refreshAccessToken().finally(() => { refreshing = null })
+        const token = await refreshing
+        original.headers.Authorization = `Bearer ${token}`
+        return api(original)
+      } catch {
+        // Fall through to logout
+      }
+    }
     if (error.response?.status === 401) {
       localStorage.removeItem('token')
+      localStorage.removeItem('refresh_token')
       window.location.href = '/login'
     }
     return Promise.reject(error)